@@ -1,20 +1,24 @@
-from flask import Flask, render_template, Response, request, redirect, url_for, flash
+from flask import Flask, render_template, Response, request, redirect, url_for, flash, jsonify, abort
 import cv2
 import face_recognition
 import numpy as np
 from face_recognizer import FaceRecognizer
 from face_recognizer_pt import FaceRecognizerPT
-from database import mark_attendance, init_db, get_attendance_records, generate_session_report
+from database import (db, cooldown, excel_log, attendance_writer, mark_attendance, init_db, generate_session_report,
+                      start_session, end_session, query_attendance, decode_cursor, get_sessions,
+                      get_day_attendance, get_session_summary, get_student_history,
+                      ATTENDANCE_COLUMNS, ATTENDANCE_PAGE_SIZE)
 import os
 import time
 from datetime import datetime
-from face_encoder import generate_encodings
-from twilio.rest import Client
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+from incremental_trainer import train_incremental
+from training_jobs import TrainingQueue
+from functools import partial
+from video_pipeline import VideoPipeline, RecognitionScheduler
+from cameras import load_cameras
+from face_detectors import make_detector
+from verification import EarlyExitPolicy
+from notifications import NotificationDispatcher, SmtpSender, TwilioSender, make_smtp_factory, make_twilio_factory
 
 import base64
 import io
@@ -29,12 +33,24 @@ init_db()
 recognizer = FaceRecognizer()
 recognizer_pt = FaceRecognizerPT()
 
-# Global state for UI hold logic: {student_id: {'until': timestamp, 'name': name}}
-display_state = {}
-
 # Constants
 HOLD_DURATION = 4  # Seconds to hold the green frame
 COOLDOWN_DURATION = 5 # Seconds before re-detecting same person (starts after hold)
+DETECT_EVERY = 5 # Full face detection every N recognized frames; faces are tracked in between (1 = detect every frame)
+FACE_DETECTOR = "hog" # hog | haar | dnn | mtcnn, or a cascade "proposer>confirmer" such as "haar>hog" (see face_detectors.py)
+# Recognition threads shared by all cameras (cameras take turns, see RecognitionScheduler).
+# Keep this at 1 unless you have checked your setup: the dlib HOG detector and face
+# encoder behind face_recognition are single shared objects that dlib does not
+# document as safe for concurrent calls. FaceNet, the DNN detector and the counters
+# are safe with more workers; on a GPU FaceNet serializes anyway.
+RECOGNITION_WORKERS = 1
+
+# Shared by every camera. Each camera keeps its own tracker, motion gate and
+# identity cache (see cameras.py): the tracker follows faces, the motion gate
+# skips still frames and the identity cache runs the models only on new faces.
+detector = make_detector(FACE_DETECTOR)
+# Skips FaceNet when the dlib distance alone is decisive (thresholds in verification.py)
+early_exit = EarlyExitPolicy()
 
 # --- Configuration ---
 # Twilio WhatsApp (Replace with your SID and Token from Twilio Console)
@@ -51,391 +67,299 @@ EMAIL_RECEIVER = "akshayprabhu19012005@gmail.com" # Sending to self by default
 
 import json
 
-# Global Camera Management
-video_capture = None
-is_registering = False
-is_attendance_active = False
-session_start_time = None
-current_session_name = "Session"
-marked_students = set()
+# Cameras (one per classroom, configured in cameras.json) each run their own session
+cameras = load_cameras(detect_every=DETECT_EVERY)
+DEFAULT_CAMERA = next(iter(cameras)) # Used by /video and forms without a cam_id
 SESSION_FILE = "session_state.json"
 
 def save_session_state():
-    state = {
-        "is_active": is_attendance_active,
-        "start_time": session_start_time.isoformat() if session_start_time else None,
-        "session_name": current_session_name
-    }
+    state = {"cameras": {cam_id: cam.session_state() for cam_id, cam in cameras.items()}}
     with open(SESSION_FILE, 'w') as f:
         json.dump(state, f)
 
 def load_session_state():
-    global is_attendance_active, session_start_time, current_session_name
     if os.path.exists(SESSION_FILE):
         try:
             with open(SESSION_FILE, 'r') as f:
                 state = json.load(f)
-                is_attendance_active = state.get("is_active", False)
-                start_time_str = state.get("start_time")
+            if "cameras" not in state:
+                state = {"cameras": {DEFAULT_CAMERA: state}} # Written before multi-camera support
+            for cam_id, cam_state in state["cameras"].items():
+                cam = cameras.get(cam_id)
+                if cam is None:
+                    continue # Camera removed from cameras.json
+                cam.is_active = cam_state.get("is_active", False)
+                start_time_str = cam_state.get("start_time")
                 if start_time_str:
-                    session_start_time = datetime.fromisoformat(start_time_str)
+                    cam.session_start_time = datetime.fromisoformat(start_time_str)
                 else:
-                    session_start_time = None
-                current_session_name = state.get("session_name", "Session")
+                    cam.session_start_time = None
+                cam.session_name = cam_state.get("session_name", "Session")
+                cam.session_id = cam_state.get("session_id")
         except Exception as e:
             print(f"Error loading session state: {e}")
 
 # Load state on startup
 load_session_state()
 
+# Email / WhatsApp are sent from the outbox by a background dispatcher (see notifications.py)
+notifier = NotificationDispatcher({
+    "email": SmtpSender(make_smtp_factory('smtp.gmail.com', 587, EMAIL_SENDER, EMAIL_PASSWORD), EMAIL_SENDER, EMAIL_RECEIVER),
+    "whatsapp": TwilioSender(make_twilio_factory(TWILIO_SID, TWILIO_AUTH_TOKEN), TWILIO_FROM, TWILIO_TO),
+})
+notifier.start()
+
 def send_email_report(file_path, summary):
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_SENDER
-        msg['To'] = EMAIL_RECEIVER
-        msg['Subject'] = f"Attendance Report - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        
-        body = f"Please find the attached attendance report for the recent session.\n\nSummary:\n{summary}"
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Attachment
-        if file_path and os.path.exists(file_path):
-            attachment = open(file_path, "rb")
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload((attachment).read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', "attachment; filename= " + os.path.basename(file_path))
-            msg.attach(part)
-            attachment.close()
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_SENDER, EMAIL_RECEIVER, text)
-        server.quit()
-        return True, "Email sent successfully."
-    except Exception as e:
-        print(f"Email Error: {e}")
-        return False, str(e)
-
-def get_camera():
-    global video_capture
-    if video_capture is None or not video_capture.isOpened():
-        # Priority 1: Index 0 (Standard Default) - Most compatible
-        print("Attempting to open camera (Index 0, Default)...")
-        video_capture = cv2.VideoCapture(0)
-        
-        # Priority 2: Index 0 (DSHOW) - Faster on some Windows PCs
-        if not video_capture.isOpened() or not video_capture.read()[0]:
-            print("Index 0 (Default) failed. Trying Index 0 (DSHOW)...")
-            if video_capture: video_capture.release()
-            video_capture = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-            
-        # Priority 3: Index 1 (Standard Default) - External Camera
-        if not video_capture.isOpened() or not video_capture.read()[0]:
-            print("Index 0 failed. Trying Index 1 (Default)...")
-            if video_capture: video_capture.release()
-            video_capture = cv2.VideoCapture(1)
-            
-        # Priority 4: Index 1 (DSHOW)
-        if not video_capture.isOpened() or not video_capture.read()[0]:
-            print("Index 1 (Default) failed. Trying Index 1 (DSHOW)...")
-            if video_capture: video_capture.release()
-            video_capture = cv2.VideoCapture(1, cv2.CAP_DSHOW)
-
-        # Final Verification
-        if video_capture.isOpened():
-            # Read a test frame to ensure stream is valid
-            ret, _ = video_capture.read()
-            if not ret:
-                print("CRITICAL: Camera opened but failed to return a frame.")
-                video_capture.release()
-                video_capture = None
-            else:
-                print("Camera initialized successfully.")
+    """Queues the session report email. Returns the outbox id."""
+    body = f"Please find the attached attendance report for the recent session.\n\nSummary:\n{summary}"
+    return notifier.enqueue("email", {
+        "subject": f"Attendance Report - {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+        "body": body,
+        "attachment": os.path.abspath(file_path) if file_path else None,
+    })
+
+def verify_identity(dlib_result, pt_result):
+    """Double verification of one face: (student_id, name) if dlib and FaceNet agree, else None."""
+    name_dlib, id_dlib, _ = dlib_result
+    name_pt, id_pt, dist_pt = pt_result
+    if name_dlib != "Unknown" and name_pt != "Unknown":
+        if id_dlib == id_pt:
+            # Both models agree -> HIGH CONFIDENCE
+            print(f"Verified: {name_dlib} (Dlib & PT agree)")
+            return (id_dlib, name_dlib) if id_dlib else None
+        # Models disagree -> Conflict -> Treat as Unknown
+        print(f"Conflict: Dlib said {name_dlib}, PT said {name_pt}")
+    elif name_dlib != "Unknown":
+        print(f"Dlib Only: {name_dlib} (PT Unsure: {dist_pt:.2f})")
+    elif name_pt != "Unknown":
+        print(f"PT Only: {name_pt} (Dlib Unsure)")
+    return None
+
+def recognize_frame(cam, frame):
+    """
+    Runs detection + double verification on one frame of `cam` (shared recognition worker).
+    Returns the annotations to draw: {'boxes': [(top, right, bottom, left, label, color, thickness)], 'banner': str|None}
+    """
+    if cam.is_registering or not cam.is_active:
+        cam.reset_recognition()
+        return None
+
+    current_time = time.time()
+    
+    # Check if we are in a "HOLD" state for any student
+    active_hold = None
+    for sid, state in list(cam.display_state.items()):
+        if current_time < state['until']:
+            active_hold = state
+            break
         else:
-            print("CRITICAL: No working camera found on Index 0 or 1.")
-            video_capture = None
-            
-    return video_capture
-
-def release_camera():
-    global video_capture
-    if video_capture is not None:
-        video_capture.release()
-        video_capture = None
-    cv2.destroyAllWindows()
-
-def generate_frames():
-    global is_registering, is_attendance_active
+            # Hold expired
+            del cam.display_state[sid]
+
+    # Use 0.5 scale for better long-range detection (more pixels = better detection)
+    scale_factor = 0.5
+    inv_scale = int(1/scale_factor)
+    small_frame = cv2.resize(frame, (0, 0), fx=scale_factor, fy=scale_factor)
+    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
     
-    while True:
-        if is_registering:
-            time.sleep(0.5)
-            continue
-            
-        if not is_attendance_active:
-            # KEEP CAMERA OPEN but show "Attendance Stopped"
-            # This prevents the DSHOW/MSMF crash when toggling on/off repeatedly
+    # Still scene -> nothing can have changed since the last result
+    if not active_hold and not cam.motion_gate.update(rgb_small_frame) and cam.last_annotations is not None:
+        return cam.last_annotations
+
+    annotations = {'boxes': [], 'banner': None}
+
+    if active_hold:
+        # === HOLD STATE ===
+        # Only follow the faces already on screen; no new detection while the result is shown
+        face_locations = cam.tracker.locate(rgb_small_frame)
+        cam.identities.assign(face_locations) # Keeps the tracks alive through the hold
+        if face_locations:
+            # Just use the first face for simplicity in hold mode
+            top, right, bottom, left = face_locations[0]
+            name = active_hold['name']
+            annotations['boxes'].append((top * inv_scale, right * inv_scale, bottom * inv_scale, left * inv_scale,
+                                         f"{name} - Mark Success", (0, 255, 0), 3))
+            # Add "Verified" text on screen center
+            annotations['banner'] = "VERIFIED"
+        cam.last_annotations = None # Recognise afresh once the hold ends
+        return annotations
+
+    # === NORMAL RECOGNITION STATE ===
+    # Detect faces (full detection every DETECT_EVERY frames, optical-flow tracking in between)
+    # and only in the regions that moved (plus the faces already tracked)
+    face_locations = cam.tracker.locate(rgb_small_frame, cam.motion_gate.restrict(detector, cam.tracker.boxes))
+    tracks = cam.identities.assign(face_locations)
+
+    # Run the models only on faces whose identity is not settled yet
+    pending = [i for i, track in enumerate(tracks) if cam.identities.needs_check(track, current_time)]
+    if pending:
+        boxes = [face_locations[i] for i in pending]
+        face_encodings = face_recognition.face_encodings(rgb_small_frame, boxes)
+        # 1. Dlib Recognition (all faces of the frame in one batched match)
+        dlib_results = recognizer.recognize_faces(face_encodings)
+        # Clear dlib results are decided here; only the ambiguous ones need the second model
+        decided, ambiguous = early_exit.split(dlib_results)
+        for j, identity in decided.items():
+            cam.identities.vote(tracks[pending[j]], identity, current_time)
+        if ambiguous:
+            # 2. PyTorch FaceNet Recognition (all ambiguous faces in one forward pass)
+            pt_results = recognizer_pt.recognize_faces(rgb_small_frame, [boxes[j] for j in ambiguous])
+            for j, pt_result in zip(ambiguous, pt_results):
+                cam.identities.vote(tracks[pending[j]], verify_identity(dlib_results[j], pt_result), current_time)
+
+    for (top, right, bottom, left), track in zip(face_locations, tracks):
+        if track.committed:
+            student_id, name = track.identity
+            display_name = f"{name} ({student_id})"
             
-            camera = get_camera()
-            if camera and camera.isOpened():
-                success, frame = camera.read()
-                if success:
-                    # Darken the frame to indicate inactivity
-                    frame = cv2.addWeighted(frame, 0.3, np.zeros(frame.shape, frame.dtype), 0, 0)
-                    cv2.putText(frame, "Attendance Stopped", (160, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                    cv2.putText(frame, "Click Start to Resume", (170, 280), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
-                    
-                    ret, buffer = cv2.imencode('.jpg', frame)
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                else:
-                    # Camera failed to read, try resetting
-                    release_camera()
-            else:
-                # Fallback if camera completely dead
-                frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(frame, "Camera Disconnected", (160, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (100, 100, 100), 2)
-                ret, buffer = cv2.imencode('.jpg', frame)
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            
-            time.sleep(0.05) # Low FPS when inactive to save CPU
-            continue
-            
-        camera = get_camera()
-        if camera is None or not camera.isOpened():
-            print("Waiting for camera...")
-            time.sleep(1)
-            continue
-
-        success, frame = camera.read()
-        if not success:
-            print("Failed to read frame from camera. Resetting...")
-            release_camera()
-            time.sleep(0.5)
-            continue
-            
-        current_time = time.time()
-        
-        # Check if we are in a "HOLD" state for any student
-        active_hold = None
-        for sid, state in list(display_state.items()):
-            if current_time < state['until']:
-                active_hold = state
-                break
-            else:
-                # Hold expired
-                del display_state[sid]
-
-        if active_hold:
-            # === HOLD STATE ===
-            # Use 0.5 scale for better long-range detection (more pixels = better detection)
-            scale_factor = 0.5
-            small_frame = cv2.resize(frame, (0, 0), fx=scale_factor, fy=scale_factor)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_small_frame)
-            
-            # If faces found, assume the largest one is our guy
-            if face_locations:
-                 # Just use the first face for simplicity in hold mode
-                top, right, bottom, left = face_locations[0]
+            # Mark attendance (remembered only once stored, so a failed write is retried on the next frame)
+            if student_id not in cam.marked_students and mark_attendance(student_id, name, cam.session_id):
+                cam.marked_students.add(student_id)
                 
-                # Scale up
-                inv_scale = int(1/scale_factor)
-                top *= inv_scale
-                right *= inv_scale
-                bottom *= inv_scale
-                left *= inv_scale
-                
-                color = (0, 255, 0) # Green
-                name = active_hold['name']
-                
-                cv2.rectangle(frame, (left, top), (right, bottom), color, 3)
-                cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-                cv2.putText(frame, f"{name} - Mark Success", (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.7, (255, 255, 255), 1)
-                
-                # Add "Verified" text on screen center
-                cv2.putText(frame, "VERIFIED", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
+                # Trigger HOLD logic
+                cam.display_state[student_id] = {
+                    'until': current_time + HOLD_DURATION,
+                    'name': name
+                }
         else:
-            # === NORMAL RECOGNITION STATE ===
-            # Use 0.5 scale for better long-range detection
-            scale_factor = 0.5
-            small_frame = cv2.resize(frame, (0, 0), fx=scale_factor, fy=scale_factor)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            display_name = "Unknown"
             
-            # Detect faces
-            face_locations = face_recognition.face_locations(rgb_small_frame)
-            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-            
-            face_names = []
-            
-            for i, face_encoding in enumerate(face_encodings):
-                # 1. Dlib Recognition
-                name_dlib, id_dlib = recognizer.recognize_face(face_encoding)
-                
-                # 2. PyTorch FaceNet Recognition
-                top, right, bottom, left = face_locations[i]
-                face_img = rgb_small_frame[top:bottom, left:right]
-                name_pt, id_pt, dist_pt = recognizer_pt.recognize_face(face_img)
-
-                # 3. Double Verification Logic
-                name = "Unknown"
-                student_id = None
-                
-                if name_dlib != "Unknown" and name_pt != "Unknown":
-                    if id_dlib == id_pt:
-                        # Both models agree -> HIGH CONFIDENCE
-                        name = name_dlib
-                        student_id = id_dlib
-                        print(f"Verified: {name} (Dlib & PT agree)")
-                    else:
-                        # Models disagree -> Conflict -> Treat as Unknown
-                        print(f"Conflict: Dlib said {name_dlib}, PT said {name_pt}")
-                elif name_dlib != "Unknown":
-                    print(f"Dlib Only: {name_dlib} (PT Unsure: {dist_pt:.2f})")
-                elif name_pt != "Unknown":
-                    print(f"PT Only: {name_pt} (Dlib Unsure)")
-                
-                if name != "Unknown" and student_id:
-                    display_name = f"{name} ({student_id})"
-                    
-                    # Mark attendance
-                    if student_id not in marked_students:
-                        mark_attendance(student_id, name)
-                        marked_students.add(student_id)
-                        
-                        # Trigger HOLD logic
-                        display_state[student_id] = {
-                            'until': current_time + HOLD_DURATION,
-                            'name': name
-                        }
-                    else:
-                        pass
-                        
-                else:
-                    display_name = "Unknown"
-                    
-                face_names.append(display_name)
-                
-            # Draw results
-            inv_scale = int(1/scale_factor)
-            for (top, right, bottom, left), name in zip(face_locations, face_names):
-                # Scale back up
-                top *= inv_scale
-                right *= inv_scale
-                bottom *= inv_scale
-                left *= inv_scale
-                
-                color = (0, 255, 0) if "Unknown" not in name else (0, 0, 255)
-                
-                cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-                cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-                cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
-            
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-
-    camera.release()
+        # Scale back up
+        color = (0, 255, 0) if "Unknown" not in display_name else (0, 0, 255)
+        annotations['boxes'].append((top * inv_scale, right * inv_scale, bottom * inv_scale, left * inv_scale,
+                                     display_name, color, 2))
+
+    cam.last_annotations = annotations
+    return annotations
+
+def render_frame(cam, frame, annotations):
+    """Draws the latest annotations onto a camera frame (encoder thread). `frame` is None when the camera is down."""
+    if frame is None:
+        # Fallback if camera completely dead
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        cv2.putText(frame, "Camera Disconnected", (160, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (100, 100, 100), 2)
+        return frame
+
+    if not cam.is_active:
+        # KEEP CAMERA OPEN but show "Attendance Stopped"
+        # This prevents the DSHOW/MSMF crash when toggling on/off repeatedly
+        # Darken the frame to indicate inactivity
+        frame = cv2.addWeighted(frame, 0.3, np.zeros(frame.shape, frame.dtype), 0, 0)
+        cv2.putText(frame, "Attendance Stopped", (160, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        cv2.putText(frame, "Click Start to Resume", (170, 280), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (200, 200, 200), 1)
+        return frame
+
+    if annotations:
+        for top, right, bottom, left, name, color, thickness in annotations['boxes']:
+            cv2.rectangle(frame, (left, top), (right, bottom), color, thickness)
+            cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
+            cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+        if annotations['banner']:
+            cv2.putText(frame, annotations['banner'], (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    return frame
+
+# Capture and JPEG encoding run on their own threads per camera, so the stream FPS
+# does not depend on how long recognition takes. Recognition runs on workers
+# shared by all cameras, which take the cameras in turn.
+scheduler = RecognitionScheduler(RECOGNITION_WORKERS)
+for cam in cameras.values():
+    cam.pipeline = VideoPipeline(cam.open, cam.release, partial(recognize_frame, cam), partial(render_frame, cam), scheduler)
+
+def get_camera(cam_id=None):
+    cam = cameras.get(cam_id or DEFAULT_CAMERA)
+    if cam is None:
+        abort(404)
+    return cam
+
+def generate_frames(cam):
+    # Every client of a camera subscribes to the same broadcaster: recognition and
+    # encoding run once per frame no matter how many viewers are connected.
+    cam.pipeline.start()
+    return cam.pipeline.broadcaster.subscribe()
 
 @app.route('/')
 def index():
-    return render_template('index.html', is_active=is_attendance_active, session_name=current_session_name)
+    cam = get_camera(request.args.get('cam'))
+    return render_template('index.html', is_active=cam.is_active, session_name=cam.session_name,
+                           camera=cam, cameras=list(cameras.values()))
 
 @app.route('/start_attendance', methods=['GET', 'POST'])
 def start_attendance():
-    global is_attendance_active, session_start_time, current_session_name, marked_students
+    cam = get_camera(request.values.get('cam_id'))
     
     if request.method == 'POST':
-        current_session_name = request.form.get('session_name', 'Session')
+        cam.session_name = request.form.get('session_name', 'Session')
     
-    is_attendance_active = True
-    session_start_time = datetime.now()
-    marked_students.clear() # Reset for new session
+    if cam.is_active and cam.session_id is not None:
+        end_session(cam.session_id) # Restarted without stopping
+    cam.is_active = True
+    cam.session_start_time = datetime.now()
+    cam.session_id = start_session(cam.session_name, cam.cam_id)
+    cam.marked_students.clear() # Reset for new session
     save_session_state() # Save state
     
-    flash(f"{current_session_name} Started at {session_start_time.strftime('%H:%M:%S')}")
-    return redirect(url_for('index'))
+    flash(f"{cam.session_name} Started at {cam.session_start_time.strftime('%H:%M:%S')}")
+    return redirect(url_for('index', cam=cam.cam_id))
 
 @app.route('/stop_attendance')
 def stop_attendance():
-    global is_attendance_active, session_start_time, current_session_name
-    is_attendance_active = False
+    cam = get_camera(request.values.get('cam_id'))
+    cam.is_active = False
+    if cam.session_id is not None:
+        end_session(cam.session_id)
     save_session_state() # Update state to inactive
     
-    msg = f"{current_session_name} Stopped."
+    msg = f"{cam.session_name} Stopped."
     
     # Generate Report if session was active
-    if session_start_time:
-        # Pass marked_students to filter only unique attendees for this session
-        # Or generate_session_report handles it. Let's inspect generate_session_report.
-        # Actually, if marked_students prevented duplicates in DB, we are good.
-        # But marked_students only prevents re-marking in THIS runtime.
-        # If generate_session_report queries DB by time, it might pick up multiple if app restarted?
-        # But we want ONE entry per person per session.
-        
-        file_path, summary, attendees = generate_session_report(session_start_time, current_session_name)
+    if cam.session_start_time:
+        file_path, summary, attendees = generate_session_report(cam.session_start_time, cam.session_name, cam.session_id)
         if file_path:
             msg += f" {summary}"
             
-            # Auto-send Email with Excel Attachment
-            email_success, email_status = send_email_report(file_path, summary)
-            
-            if email_success:
-                msg += " [Email Sent]"
-            else:
-                print(f"Email Failed: {email_status}") # Log full error to console
-                msg += " [Email Failed]" # Show simple message to user
+            # Auto-send Email with Excel Attachment (queued; sent in the background)
+            send_email_report(file_path, summary)
+            msg += " [Email queued]"
 
             # Auto-send via Twilio (Text Summary)
-            try:
-                client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
-                
-                # Construct message
-                whatsapp_msg = f"🛑 {current_session_name} Report\n"
-                whatsapp_msg += f"📅 {datetime.now().strftime('%Y-%m-%d')}\n"
-                whatsapp_msg += f"⏰ {session_start_time.strftime('%H:%M')} - {datetime.now().strftime('%H:%M')}\n\n"
-                
-                if attendees:
-                    whatsapp_msg += "✅ Present:\n"
-                    for student in attendees:
-                        # student = (name, id, time)
-                        whatsapp_msg += f"• {student[0]} ({student[1]}) - {student[2]}\n"
-                else:
-                    whatsapp_msg += "No students detected.\n"
-                
-                whatsapp_msg += "\n(Excel file saved locally)"
-
-                message = client.messages.create(
-                    from_=TWILIO_FROM,
-                    body=whatsapp_msg,
-                    to=TWILIO_TO
-                )
-                msg += f" (WhatsApp sent: {message.sid})"
-            except Exception as e:
-                print(f"Twilio Auto-Send Error: {e}")
-                msg += " (WhatsApp failed - Check console)"
+            # Construct message
+            room = f" ({cam.name})" if len(cameras) > 1 else ""
+            whatsapp_msg = f"🛑 {cam.session_name}{room} Report\n"
+            whatsapp_msg += f"📅 {datetime.now().strftime('%Y-%m-%d')}\n"
+            whatsapp_msg += f"⏰ {cam.session_start_time.strftime('%H:%M')} - {datetime.now().strftime('%H:%M')}\n\n"
+            
+            if attendees:
+                whatsapp_msg += "✅ Present:\n"
+                for student in attendees:
+                    # student = (name, id, time)
+                    whatsapp_msg += f"• {student[0]} ({student[1]}) - {student[2]}\n"
+            else:
+                whatsapp_msg += "No students detected.\n"
+            
+            whatsapp_msg += "\n(Excel file saved locally)"
+            notifier.enqueue("whatsapp", {"body": whatsapp_msg})
+            msg += " (WhatsApp queued)"
         else:
             msg += " No records found in this session."
             
-    session_start_time = None # Reset
+    cam.session_start_time = None # Reset
+    cam.session_id = None
+    save_session_state()
     flash(msg)
-    return redirect(url_for('index'))
+    return redirect(url_for('index', cam=cam.cam_id))
 
 @app.route('/video')
 def video():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(generate_frames(get_camera()), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/video/<cam_id>')
+def video_camera(cam_id):
+    return Response(generate_frames(get_camera(cam_id)), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
-        global is_registering
+        cam = get_camera(request.form.get('cam_id'))
         student_id = request.form['student_id']
         name = request.form['name']
         
@@ -448,72 +372,149 @@ def register():
         if not os.path.exists(folder_path):
             os.makedirs(folder_path)
             
-        # Capture images using global camera
-        is_registering = True
-        time.sleep(1) # Wait for generator to pause
+        # Capture images from the camera's capture thread (it owns the camera)
+        cam.is_registering = True
+        cam.pipeline.start()
         
-        cap = get_camera()
         count = 0
+        seq = 0
         while count < 20:
-            ret, frame = cap.read()
-            if not ret:
+            new_seq, frame, _ = cam.pipeline.frames.wait_newer(seq, timeout=1.0)
+            if new_seq == seq or frame is None:
                 time.sleep(0.1)
                 continue
+            seq = new_seq
             cv2.imwrite(os.path.join(folder_path, f"{count}.jpg"), frame)
             count += 1
             time.sleep(0.2)
         
-        is_registering = False
+        cam.is_registering = False
         
         flash(f"Registered {name} successfully! Captured {count} images.")
-        return redirect(url_for('index'))
+        return redirect(url_for('index', cam=cam.cam_id))
         
-    return render_template('register.html')
+    return render_template('register.html', cameras=list(cameras.values()))
 
 @app.route('/send_report')
 def send_report():
-    try:
-        client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
-        
-        # Get today's attendance summary
-        records = get_attendance_records()
-        today_str = time.strftime("%Y-%m-%d")
-        today_records = [r for r in records if r[3] == today_str]
-        
-        msg_body = f"Attendance Report for {today_str}:\n"
-        if not today_records:
-            msg_body += "No attendance marked today."
-        else:
-            for r in today_records:
-                msg_body += f"- {r[2]} ({r[1]}) at {r[4]}\n"
-        
-        message = client.messages.create(
-            from_=TWILIO_FROM,
-            body=msg_body,
-            to=TWILIO_TO
-        )
-        flash(f"Report sent via WhatsApp! SID: {message.sid}")
-    except Exception as e:
-        flash("Failed to send report. Check console for details.")
-        print(f"Twilio Error: {e}")
+    # Get today's attendance summary (one row per student, from the daily aggregate)
+    today_str = time.strftime("%Y-%m-%d")
+    today_records = get_day_attendance(today_str)
+    
+    msg_body = f"Attendance Report for {today_str}:\n"
+    if not today_records:
+        msg_body += "No attendance marked today."
+    else:
+        for student_id, name, first_ts, _, _ in today_records:
+            msg_body += f"- {name} ({student_id}) at {datetime.fromtimestamp(first_ts).strftime('%H:%M:%S')}\n"
+    
+    notifier.enqueue("whatsapp", {"body": msg_body})
+    flash("Report queued for WhatsApp. It will be sent in the background.")
         
     return redirect(url_for('attendance'))
 
+def swap_galleries(summaries):
+    # Hot-swap both galleries in place (no restart, no new model instances)
+    recognizer.load_encodings()
+    recognizer_pt.load_encodings()
+
+# Training runs on its own worker so /train returns immediately; see training_jobs.py
+# Encoder processes are started with "spawn", which re-imports this module (DB writers,
+# notifier, cameras, models) in every worker, so the app always encodes in-process.
+# Use `python incremental_trainer.py` / face_encoder.py --workers N for parallel runs.
+TRAIN_WORKERS = 1
+trainer = TrainingQueue(partial(train_incremental, workers=TRAIN_WORKERS), on_finish=swap_galleries)
+
 @app.route('/train', methods=['GET', 'POST'])
 def train():
     if request.method == 'POST':
-        generate_encodings()
-        # Reload recognizer
-        global recognizer
-        recognizer = FaceRecognizer()
-        flash("Model trained successfully!")
-        return redirect(url_for('index'))
-    return render_template('train.html')
+        # Only new/changed images are encoded; deleted ones are dropped
+        job, coalesced = trainer.submit()
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({"job": job, "coalesced": coalesced}), 202
+        if coalesced:
+            flash(f"Training job {job['id']} is already queued.")
+        else:
+            flash(f"Training job {job['id']} started. Recognition keeps using the current model until it finishes.")
+        return redirect(url_for('train'))
+    return render_template('train.html', status=trainer.status())
+
+@app.route('/train/status')
+def train_status():
+    return jsonify(trainer.status())
+
+def attendance_filters(args):
+    """Filters shared by /attendance and /api/attendance. Raises ValueError on malformed input."""
+    date = args.get('date') or None
+    if date:
+        datetime.strptime(date, "%Y-%m-%d")
+    session_id = args.get('session_id') or None
+    cursor = args.get('cursor') or None
+    if cursor:
+        decode_cursor(cursor)
+    return {
+        "date": date,
+        "student_id": args.get('student_id') or None,
+        "session_id": int(session_id) if session_id else None,
+        "cursor": cursor,
+    }
 
 @app.route('/attendance')
 def attendance():
-    records = get_attendance_records()
-    return render_template('attendance.html', records=records)
+    try:
+        filters = attendance_filters(request.args)
+    except ValueError:
+        flash("Invalid filter.")
+        return redirect(url_for('attendance'))
+    records, next_cursor = query_attendance(**filters)
+    return render_template('attendance.html', records=records, next_cursor=next_cursor,
+                           filters=filters, sessions=get_sessions())
+
+@app.route('/api/attendance')
+def api_attendance():
+    """Same data as /attendance as JSON: ?date=YYYY-MM-DD&student_id=&session_id=&cursor=&limit="""
+    try:
+        filters = attendance_filters(request.args)
+        limit = min(max(int(request.args.get('limit', ATTENDANCE_PAGE_SIZE)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "invalid filter"}), 400
+    records, next_cursor = query_attendance(limit=limit, **filters)
+    return jsonify({
+        "records": [dict(zip(ATTENDANCE_COLUMNS, r)) for r in records],
+        "next_cursor": next_cursor,
+    })
+
+@app.route('/api/sessions/<int:session_id>/summary')
+def api_session_summary(session_id):
+    enrolled = len(set(recognizer.known_ids)) # Students in the current gallery
+    return jsonify(get_session_summary(session_id, enrolled))
+
+@app.route('/api/students/<student_id>/history')
+def api_student_history(student_id):
+    rows = get_student_history(student_id)
+    return jsonify({
+        "student_id": student_id,
+        "sessions": [dict(zip(["session_id", "session_name", "first_ts", "last_ts", "hits"], r)) for r in rows],
+    })
+
+def detection_stats(cam):
+    return dict(cam.tracker.stats(), motion_gate=cam.motion_gate.stats(), identities=cam.identities.stats())
+
+def camera_stats():
+    return {cam_id: {"name": cam.name, "active": cam.is_active, "session_id": cam.session_id,
+                     "pipeline": cam.pipeline.stats(), "detection": detection_stats(cam)}
+            for cam_id, cam in cameras.items()}
+
+def recognition_stats():
+    stats = dict(scheduler.stats(), detector=detector.name, early_exit=early_exit.stats())
+    if hasattr(detector, "stats"):
+        stats["cascade"] = detector.stats()
+    return stats
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({"cameras": camera_stats(), "recognition": recognition_stats(), "training": trainer.status(), "database": db.stats(), "cooldown": cooldown.stats(), "excel_log": excel_log.stats(), "attendance_writer": attendance_writer.stats(),
+                    "notifications": notifier.stats()})
 
 if __name__ == "__main__":
     print("Starting Flask App...")
@@ -0,0 +1,71 @@
+import argparse
+import os
+import time
+import cv2
+from face_detectors import make_detector, CascadeDetector
+from face_encoder import DATASET_DIR
+
+DEFAULT_DETECTORS = "hog,haar,dnn,mtcnn,haar>hog,haar>dnn"
+
+
+def load_images(scale, limit):
+    """dataset/ images as RGB at the scale the live path uses. Every image holds one face."""
+    images = []
+    for student_folder in sorted(os.listdir(DATASET_DIR)):
+        student_path = os.path.join(DATASET_DIR, student_folder)
+        if not os.path.isdir(student_path):
+            continue
+        for filename in sorted(os.listdir(student_path)):
+            image = cv2.imread(os.path.join(student_path, filename))
+            if image is None:
+                continue
+            if scale != 1.0:
+                image = cv2.resize(image, (0, 0), fx=scale, fy=scale)
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            if limit and len(images) >= limit:
+                return images
+    return images
+
+
+def run_report(specs, scale, limit):
+    """Latency and recall per detector backend (recall = share of dataset images with a face found)."""
+    print("Loading images from dataset/ ...")
+    images = load_images(scale, limit)
+    if not images:
+        print("No images found in dataset.")
+        return
+    height, width = images[0].shape[:2]
+    print(f"{len(images)} images at scale {scale} (first is {width}x{height})\n")
+
+    print(f"{'detector':<14}{'ms/image':>10}{'recall':>10}{'extra/img':>11}")
+    for spec in specs:
+        try:
+            detector = make_detector(spec)
+        except Exception as e:
+            print(f"{spec:<14}  skipped: {e}")
+            continue
+        detector(images[0]) # Warm-up (model load, first allocation)
+        if isinstance(detector, CascadeDetector):
+            detector.proposals = detector.confirmed = 0
+
+        found, extra = 0, 0
+        start = time.perf_counter()
+        for rgb in images:
+            boxes = detector(rgb)
+            found += bool(boxes)
+            extra += max(len(boxes) - 1, 0)
+        per_image = (time.perf_counter() - start) / len(images) * 1000
+        print(f"{spec:<14}{per_image:>10.2f}{found / len(images):>10.3f}{extra / len(images):>11.3f}")
+        if isinstance(detector, CascadeDetector):
+            stats = detector.stats()
+            print(f"{'':<14}{stats['proposals']} proposals, {stats['confirmed']} confirmed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency / recall report for the face detector backends.")
+    parser.add_argument("--detectors", default=DEFAULT_DETECTORS,
+                        help="Comma separated; 'a>b' is a cascade (a proposes, b confirms)")
+    parser.add_argument("--scale", type=float, default=0.5, help="Resize factor applied before detection (app uses 0.5)")
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N images (0 = all)")
+    args = parser.parse_args()
+    run_report([spec.strip() for spec in args.detectors.split(",") if spec.strip()], args.scale, args.limit)
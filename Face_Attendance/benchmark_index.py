@@ -0,0 +1,104 @@
+import argparse
+import os
+import time
+import cv2
+import face_recognition
+import numpy as np
+from face_matcher import FaceMatcher
+from face_index import IVFIndex
+from gallery_store import load_gallery
+
+ENCODINGS_FILE = "encodings.gallery"
+LEGACY_PICKLE_FILE = "encodings.pkl"
+DATASET_DIR = "dataset"
+
+
+def load_queries(max_per_student=5):
+    """Encodes up to `max_per_student` images per dataset/ID_Name folder (no jitter, like the live path)."""
+    queries, ids = [], []
+    for student_folder in sorted(os.listdir(DATASET_DIR)):
+        folder_path = os.path.join(DATASET_DIR, student_folder)
+        if not os.path.isdir(folder_path):
+            continue
+        images = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+        for img_name in images[:max_per_student]:
+            image = cv2.imread(os.path.join(folder_path, img_name))
+            if image is None:
+                continue
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            encodings = face_recognition.face_encodings(rgb_image, face_recognition.face_locations(rgb_image))
+            if encodings:
+                queries.append(encodings[0])
+                ids.append(student_folder.split('_', 1)[0])
+    return np.asarray(queries, dtype=np.float32), ids
+
+
+def build_gallery(size, seed=0):
+    """Enrolled encodings from the gallery padded with synthetic distractor identities up to `size` vectors."""
+    data = load_gallery(ENCODINGS_FILE, LEGACY_PICKLE_FILE, model="dlib")
+    real = np.asarray(data["encodings"], dtype=np.float32)
+    names, ids = list(data["names"]), list(data["ids"])
+
+    matcher = FaceMatcher(real.shape[1], capacity=max(size, len(real)))
+    matcher.add(real, names, ids)
+
+    missing = size - len(real)
+    if missing > 0:
+        # Distractors: random "students" drawn from the per-dimension spread of real faces,
+        # each with a handful of noisy images like a real enrollment
+        rng = np.random.default_rng(seed)
+        per_student = 10
+        n_students = (missing + per_student - 1) // per_student
+        mean, std = real.mean(axis=0), real.std(axis=0) + 1e-3
+        centres = rng.normal(mean, std * 1.5, size=(n_students, real.shape[1])).astype(np.float32)
+        fake = np.repeat(centres, per_student, axis=0)[:missing]
+        fake += rng.normal(0, std * 0.3, size=fake.shape).astype(np.float32)
+        fake_ids = [f"x{i // per_student}" for i in range(missing)]
+        matcher.add(fake, fake_ids, fake_ids)
+    return matcher
+
+
+def timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = fn()
+    return (time.perf_counter() - start) / repeats, out
+
+
+def run_benchmark(gallery_size, probes, repeats):
+    print(f"Loading queries from {DATASET_DIR}/ ...")
+    queries, truth = load_queries()
+    if not len(queries):
+        print("No faces found in dataset.")
+        return
+    matcher = build_gallery(gallery_size)
+    print(f"Gallery: {len(matcher)} vectors, {len(queries)} queries\n")
+
+    exact_time, (exact_idx, _) = timed(lambda: matcher.exact_search(queries, 1), repeats)
+    exact_ids = [matcher.ids[i] for i in exact_idx[:, 0]]
+    exact_acc = np.mean([a == b for a, b in zip(exact_ids, truth)])
+    print(f"{'backend':<16}{'ms/face':>10}{'recall@1':>10}{'id-acc':>10}")
+    print(f"{'exact':<16}{exact_time / len(queries) * 1000:>10.3f}{1.0:>10.3f}{exact_acc:>10.3f}")
+
+    index = IVFIndex(matcher)
+    start = time.perf_counter()
+    index.build()
+    print(f"(IVF build: {len(index.centroids)} lists in {time.perf_counter() - start:.1f}s)")
+
+    for n_probe in probes:
+        index.n_probe = n_probe
+        ivf_time, (ivf_idx, _) = timed(lambda: index.search(queries, 1), repeats)
+        recall = np.mean(ivf_idx[:, 0] == exact_idx[:, 0])
+        ivf_ids = [matcher.ids[i] if i >= 0 else None for i in ivf_idx[:, 0]]
+        acc = np.mean([a == b for a, b in zip(ivf_ids, truth)])
+        label = f"ivf nprobe={n_probe}"
+        print(f"{label:<16}{ivf_time / len(queries) * 1000:>10.3f}{recall:>10.3f}{acc:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency of the IVF index against exact search.")
+    parser.add_argument("--gallery-size", type=int, default=200000)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    run_benchmark(args.gallery_size, args.probes, args.repeats)
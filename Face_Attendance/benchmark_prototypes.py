@@ -0,0 +1,53 @@
+import argparse
+import time
+import numpy as np
+from face_recognizer import THRESHOLD
+from face_prototypes import compile_prototypes, PrototypeSearch
+from benchmark_index import load_queries, build_gallery
+
+
+def evaluate(label, identify, queries, truth, exact, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        results = identify(queries)
+    per_face = (time.perf_counter() - start) / repeats / len(queries) * 1000
+    ids = [student_id for _, student_id, _ in results]
+    accuracy = np.mean([a == b for a, b in zip(ids, truth)])
+    agreement = np.mean([a == b for a, b in zip(ids, exact)])
+    print(f"{label:<22}{per_face:>10.3f}{accuracy:>10.3f}{agreement:>12.3f}")
+    return ids
+
+
+def run_report(gallery_size, repeats):
+    """Speed vs accuracy of prototype matching, using the same PASS/FAIL rule as test_prediction.py."""
+    print("Loading queries from dataset/ ...")
+    queries, truth = load_queries()
+    if not len(queries):
+        print("No faces found in dataset.")
+        return
+    matcher = build_gallery(gallery_size)
+    print(f"Gallery: {len(matcher)} vectors, {len(queries)} queries, threshold {THRESHOLD}\n")
+
+    print(f"{'mode':<22}{'ms/face':>10}{'accuracy':>10}{'vs. exact':>12}")
+    exact = evaluate("raw (exact)", lambda q: matcher.identify(q, THRESHOLD), queries, truth, truth, repeats)
+
+    configs = [("mean", 1), ("medoids", 1), ("medoids", 2), ("medoids", 3)]
+    for method, per_student in configs:
+        start = time.perf_counter()
+        prototypes = compile_prototypes(matcher.vectors, matcher.names, matcher.ids, method, per_student)
+        compile_time = time.perf_counter() - start
+        search = PrototypeSearch(matcher, prototypes)
+        label = f"{method} k={per_student}" if method == "medoids" else method
+        evaluate(label, lambda q: search.identify(q, THRESHOLD), queries, truth, exact, repeats)
+        stats = search.stats()
+        total = max(sum(stats.values()), 1)
+        print(f"{'':<22}{len(prototypes['vectors'])} prototypes, compiled in {compile_time:.1f}s, "
+              f"fallback to raw on {stats['fallbacks'] / total:.0%} of faces")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speed vs accuracy report for the compiled prototype gallery.")
+    parser.add_argument("--gallery-size", type=int, default=0, help="Pad the gallery with synthetic students up to this size")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    run_report(args.gallery_size, args.repeats)
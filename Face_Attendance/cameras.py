@@ -0,0 +1,156 @@
+import json
+import os
+import time
+import cv2
+from face_tracker import FaceTracker, DETECT_EVERY
+from motion_gate import MotionGate
+from identity_cache import IdentityCache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# {"room101": {"name": "Room 101", "source": 0}, "room102": {"name": "Room 102", "source": "rtsp://..."}, ...}
+# source: device index, RTSP/HTTP URL or a video file (played in a loop, handy for testing).
+# Without this file there is one camera, "main", found by probing device 0 and 1 as before.
+CAMERAS_FILE = os.path.join(BASE_DIR, "cameras.json")
+DEFAULT_CAMERA = "main"
+
+
+def open_default_camera():
+    """Probes device 0 and 1 (default backend, then DSHOW) and returns the first that delivers a frame, or None."""
+    # Priority 1: Index 0 (Standard Default) - Most compatible
+    print("Attempting to open camera (Index 0, Default)...")
+    video_capture = cv2.VideoCapture(0)
+
+    # Priority 2: Index 0 (DSHOW) - Faster on some Windows PCs
+    if not video_capture.isOpened() or not video_capture.read()[0]:
+        print("Index 0 (Default) failed. Trying Index 0 (DSHOW)...")
+        if video_capture: video_capture.release()
+        video_capture = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+
+    # Priority 3: Index 1 (Standard Default) - External Camera
+    if not video_capture.isOpened() or not video_capture.read()[0]:
+        print("Index 0 failed. Trying Index 1 (Default)...")
+        if video_capture: video_capture.release()
+        video_capture = cv2.VideoCapture(1)
+
+    # Priority 4: Index 1 (DSHOW)
+    if not video_capture.isOpened() or not video_capture.read()[0]:
+        print("Index 1 (Default) failed. Trying Index 1 (DSHOW)...")
+        if video_capture: video_capture.release()
+        video_capture = cv2.VideoCapture(1, cv2.CAP_DSHOW)
+
+    # Final Verification
+    if video_capture.isOpened():
+        # Read a test frame to ensure stream is valid
+        ret, _ = video_capture.read()
+        if not ret:
+            print("CRITICAL: Camera opened but failed to return a frame.")
+            video_capture.release()
+            return None
+        print("Camera initialized successfully.")
+        return video_capture
+    print("CRITICAL: No working camera found on Index 0 or 1.")
+    return None
+
+
+class _PacedFile:
+    """A video file read at its own frame rate (a camera never delivers faster than real time)."""
+
+    def __init__(self, path):
+        self.capture = cv2.VideoCapture(path)
+        fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.interval = 1.0 / fps if fps and fps > 0 else 1.0 / 25
+        self._next = time.time()
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def read(self):
+        delay = self._next - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next + self.interval, time.time())
+        return self.capture.read() # (False, None) at the end -> the capture thread reopens it from the start
+
+    def release(self):
+        self.capture.release()
+
+
+class Camera:
+    """One capture source with its own attendance session and recognition state."""
+
+    def __init__(self, cam_id, name=None, source=None, detect_every=DETECT_EVERY):
+        self.cam_id = cam_id
+        self.name = name or cam_id
+        self.source = source
+        self._capture = None
+
+        # Session state (persisted by the app in session_state.json)
+        self.is_active = False
+        self.is_registering = False
+        self.session_start_time = None
+        self.session_name = "Session"
+        self.session_id = None # Row in the sessions table
+        self.marked_students = set()
+        # UI hold logic: {student_id: {'until': timestamp, 'name': name}}
+        self.display_state = {}
+
+        # Recognition state, only ever touched by one recognition worker at a time
+        self.tracker = FaceTracker(detect_every)
+        self.motion_gate = MotionGate()
+        self.identities = IdentityCache()
+        self.last_annotations = None
+
+        self.pipeline = None # VideoPipeline, attached by the app
+
+    def open(self):
+        if self._capture is None or not self._capture.isOpened():
+            if self.source is None:
+                self._capture = open_default_camera()
+            elif isinstance(self.source, int):
+                self._capture = cv2.VideoCapture(self.source)
+            elif os.path.isfile(self.source):
+                self._capture = _PacedFile(self.source)
+            else:
+                self._capture = cv2.VideoCapture(self.source) # RTSP / HTTP stream
+        return self._capture
+
+    def release(self):
+        capture, self._capture = self._capture, None
+        if capture is not None:
+            capture.release()
+
+    def reset_recognition(self):
+        self.tracker.reset()
+        self.motion_gate.reset()
+        self.identities.reset()
+        self.last_annotations = None
+
+    def session_state(self):
+        return {
+            "is_active": self.is_active,
+            "start_time": self.session_start_time.isoformat() if self.session_start_time else None,
+            "session_name": self.session_name,
+            "session_id": self.session_id,
+        }
+
+
+def _parse_source(source):
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    if isinstance(source, str) and not source.startswith(("rtsp://", "http://", "https://")) and not os.path.isabs(source):
+        return os.path.join(BASE_DIR, source)
+    return source
+
+
+def load_cameras(path=CAMERAS_FILE, detect_every=DETECT_EVERY):
+    """Returns {cam_id: Camera} in config order (a single default camera without a config file)."""
+    if not os.path.exists(path):
+        return {DEFAULT_CAMERA: Camera(DEFAULT_CAMERA, "Main", None, detect_every)}
+    with open(path, 'r') as f:
+        config = json.load(f)
+    cameras = {}
+    for cam_id, entry in config.items():
+        cameras[cam_id] = Camera(cam_id, entry.get("name"), _parse_source(entry.get("source")), detect_every)
+    if not cameras:
+        raise ValueError(f"{path} defines no cameras")
+    return cameras
@@ -1,7 +1,17 @@
 import sqlite3
 import os
+import atexit
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from openpyxl.packaging.custom import IntProperty
 from openpyxl.styles import PatternFill, Font
 
 DB_FOLDER = "Attendance"
@@ -9,11 +19,228 @@ DB_NAME = "attendance.db"
 DB_PATH = os.path.join(DB_FOLDER, DB_NAME)
 EXCEL_FILE = os.path.join(DB_FOLDER, "Attendance_Log.xlsx")
 
+# Connection settings
+BUSY_TIMEOUT = 5.0 # Seconds SQLite waits for a lock before reporting "database is locked"
+LOCK_RETRIES = 5 # Extra attempts (with backoff) if it still does
+POOL_SIZE = 8 # Idle connections kept open for reuse
+STATEMENT_CACHE_SIZE = 64 # Prepared statements cached per connection
+STREAM_CHUNK = 500 # Rows fetched at a time when streaming reports
+MARK_COOLDOWN = 180 # Seconds before the same student can be marked again
+
+# Hot statements. sqlite3 caches prepared statements per connection by SQL text,
+# so running these exact strings on a pooled connection skips re-preparing them.
+# SQL_RECENT_MARKS warms the cooldown cache from idx_attendance_ts.
+SQL_RECENT_MARKS = "SELECT student_id, session_id, MAX(ts) FROM attendance WHERE ts >= ? GROUP BY student_id, session_id"
+SQL_INSERT_MARK = "INSERT INTO attendance (student_id, name, date, time, ts, session_id) VALUES (?, ?, ?, ?, ?, ?)"
+# Aggregates kept up to date in the same transaction as each mark
+SQL_UPSERT_SESSION_AGG = """
+    INSERT INTO session_attendance (session_id, student_id, name, first_ts, last_ts, hits) VALUES (?, ?, ?, ?, ?, 1)
+    ON CONFLICT (session_id, student_id) DO UPDATE SET
+        first_ts = MIN(first_ts, excluded.first_ts), last_ts = MAX(last_ts, excluded.last_ts), hits = hits + 1
+"""
+SQL_UPSERT_DAILY_AGG = """
+    INSERT INTO daily_attendance (day, student_id, name, first_ts, last_ts, hits) VALUES (?, ?, ?, ?, ?, 1)
+    ON CONFLICT (day, student_id) DO UPDATE SET
+        first_ts = MIN(first_ts, excluded.first_ts), last_ts = MAX(last_ts, excluded.last_ts), hits = hits + 1
+"""
+
+
+def _is_locked(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def _is_transient(error):
+    """True for errors worth retrying as is: a held lock or a disk / I/O problem (not a bad row or schema)."""
+    if isinstance(error, OSError):
+        return True
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return _is_locked(error) or "disk" in message or "i/o" in message or "unable to open" in message
+
+
+class ConnectionPool:
+    """
+    Thread-safe SQLite access. Connections are in WAL mode (readers never block
+    the writer and vice versa) and are checked out for one operation at a time,
+    so the camera/recognition threads and Flask's per-request threads all reuse
+    a small set of open connections instead of connecting on every call.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.lock_retries = 0
+
+    def _connect(self):
+        # isolation_level=None: transactions are begun explicitly (see write())
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL") # Durable at checkpoints; safe with WAL
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                keep = len(self._idle) < self.size
+                if keep:
+                    self._idle.append(conn)
+            if not keep:
+                conn.close()
+
+    def _retry(self, fn):
+        delay = 0.05
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                with self.connection() as conn:
+                    return fn(conn)
+            except sqlite3.OperationalError as e:
+                if not _is_locked(e) or attempt == LOCK_RETRIES:
+                    raise
+                with self._lock:
+                    self.lock_retries += 1
+                print(f"Database busy, retrying ({attempt + 1}/{LOCK_RETRIES})...")
+                time.sleep(delay)
+                delay *= 2
+
+    def read(self, sql, params=()):
+        """Runs a query and returns all rows."""
+        return self._retry(lambda conn: conn.execute(sql, params).fetchall())
+
+    def stream(self, sql, params=(), chunk=STREAM_CHUNK):
+        """Yields a query's rows a chunk at a time, holding one pooled connection until exhausted."""
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    return
+                yield from rows
+
+    def write(self, fn):
+        """
+        Runs fn(conn) in one transaction and returns its result.
+        BEGIN IMMEDIATE takes the write lock up front, so a read-then-insert
+        can't be refused half way by a concurrent writer.
+        """
+        def transaction(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        return self._retry(transaction)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {"opened": self.opened, "idle": len(self._idle), "lock_retries": self.lock_retries}
+
+
+db = ConnectionPool(DB_PATH)
+
+
+class CooldownCache:
+    """
+    Last mark time per (student_id, session_id), kept for `ttl` seconds, so the
+    "marked in the last 3 minutes?" question is answered without touching
+    SQLite or Excel. Keyed by session so that a student seen by two cameras
+    running separate sessions is marked in both.
+    Warmed from the marks of the last `ttl` seconds on first use, so the
+    cooldown also holds across app restarts.
+    """
+
+    def __init__(self, ttl=MARK_COOLDOWN):
+        self.ttl = ttl
+        self._last = {}
+        self._lock = threading.Lock()
+        self._warm = False
+        self._next_evict = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _warm_up(self, now_ts):
+        rows = db.read(SQL_RECENT_MARKS, (now_ts - self.ttl,))
+        for student_id, session_id, ts in rows:
+            key = (student_id, session_id)
+            if ts is not None and ts > self._last.get(key, 0.0):
+                self._last[key] = ts
+        self._warm = True
+
+    def _evict(self, now_ts):
+        expired = [key for key, ts in self._last.items() if now_ts - ts >= self.ttl]
+        for key in expired:
+            del self._last[key]
+        self._next_evict = now_ts + self.ttl
+
+    def reserve(self, student_id, now_ts, session_id=None):
+        """
+        Returns (True, None) and records the mark if the student is outside the cooldown
+        for this session, else (False, seconds since the last mark). Check and record
+        happen under one lock, so two threads can't both mark the same student.
+        """
+        key = (student_id, session_id)
+        with self._lock:
+            if not self._warm:
+                self._warm_up(now_ts)
+            if now_ts >= self._next_evict:
+                self._evict(now_ts)
+            last = self._last.get(key)
+            if last is not None and now_ts - last < self.ttl:
+                self.hits += 1
+                return False, now_ts - last
+            self.misses += 1
+            self._last[key] = now_ts
+            return True, None
+
+    def release(self, student_id, now_ts, session_id=None):
+        """Undoes reserve() when the mark could not be stored."""
+        key = (student_id, session_id)
+        with self._lock:
+            if self._last.get(key) == now_ts:
+                del self._last[key]
+
+    def stats(self):
+        with self._lock:
+            return {"students": len(self._last), "suppressed": self.hits, "new_marks": self.misses}
+
+
+cooldown = CooldownCache()
+
 def init_db():
     if not os.path.exists(DB_FOLDER):
         os.makedirs(DB_FOLDER)
-    
-    conn = sqlite3.connect(DB_PATH)
+
+    migrate_db()
+    print("Database initialized successfully.")
+    init_excel()
+    if not attendance_writer.is_alive() and not attendance_writer._stopping:
+        attendance_writer.start()
+        atexit.register(attendance_writer.stop) # Registered after the Excel writer, so it runs first
+
+def _create_tables(conn):
     cursor = conn.cursor()
     
     # Create students table
@@ -34,218 +261,786 @@ def init_db():
             time TEXT NOT NULL
         )
     ''')
-    
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully.")
-    init_excel()
+
+def _add_sessions_and_timestamps(conn):
+    """
+    ts: epoch seconds of the mark (date/time stay for display and Excel).
+    session_id: the session the mark belongs to (NULL for marks made before sessions existed).
+    Columns are appended, so `SELECT *` row positions used by the templates don't change.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            started_ts REAL NOT NULL,
+            ended_ts REAL
+        )
+    ''')
+    conn.execute("ALTER TABLE attendance ADD COLUMN ts REAL")
+    conn.execute("ALTER TABLE attendance ADD COLUMN session_id INTEGER REFERENCES sessions(id)")
+    # Existing rows were written in local time
+    conn.execute("UPDATE attendance SET ts = CAST(strftime('%s', date || ' ' || time, 'utc') AS REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_ts ON attendance (student_id, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_session_ts ON attendance (session_id, ts, student_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance (ts)")
+
+def _add_outbox(conn):
+    """Notifications waiting to be sent (or given up on), see notifications.py."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_ts REAL NOT NULL,
+            last_error TEXT,
+            created_ts REAL NOT NULL,
+            sent_ts REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_ts)")
+
+def _add_aggregates(conn):
+    """
+    One row per (session, student) and per (day, student): first/last mark and number of marks.
+    Reports, summaries and per-student histories read these instead of raw marks.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS session_attendance (
+            session_id INTEGER NOT NULL REFERENCES sessions(id),
+            student_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            first_ts REAL NOT NULL,
+            last_ts REAL NOT NULL,
+            hits INTEGER NOT NULL,
+            PRIMARY KEY (session_id, student_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_session_attendance_first ON session_attendance (session_id, first_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_session_attendance_student ON session_attendance (student_id, first_ts)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_attendance (
+            day TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            first_ts REAL NOT NULL,
+            last_ts REAL NOT NULL,
+            hits INTEGER NOT NULL,
+            PRIMARY KEY (day, student_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_attendance_first ON daily_attendance (day, first_ts)")
+    _rebuild_aggregates(conn)
+
+def _rebuild_aggregates(conn):
+    """Recomputes both aggregate tables from the raw marks (SQLite takes `name` from the MIN(ts) row)."""
+    conn.execute("DELETE FROM session_attendance")
+    conn.execute("DELETE FROM daily_attendance")
+    conn.execute('''
+        INSERT INTO session_attendance (session_id, student_id, name, first_ts, last_ts, hits)
+        SELECT session_id, student_id, name, MIN(ts), MAX(ts), COUNT(*)
+        FROM attendance WHERE session_id IS NOT NULL AND ts IS NOT NULL
+        GROUP BY session_id, student_id
+    ''')
+    conn.execute('''
+        INSERT INTO daily_attendance (day, student_id, name, first_ts, last_ts, hits)
+        SELECT date, student_id, name, MIN(ts), MAX(ts), COUNT(*)
+        FROM attendance WHERE ts IS NOT NULL
+        GROUP BY date, student_id
+    ''')
+
+def _add_session_camera(conn):
+    """camera_id: which camera (classroom) ran the session; NULL for sessions from before multi-camera support."""
+    # fix_db.py resets user_version but keeps the sessions table, so the column may already be there
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+    if "camera_id" not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN camera_id TEXT")
+
+def _add_outbox_lease(conn):
+    """lease_until: while a dispatcher is sending a row it is 'sending' until this time, then claimable again."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(outbox)")]
+    if "lease_until" not in columns:
+        conn.execute("ALTER TABLE outbox ADD COLUMN lease_until REAL")
+
+def _fill_missing_ts(conn):
+    """
+    Legacy rows whose date/time did not parse got ts = NULL in migration 2, and a NULL
+    ts breaks the (ts, id) paging cursor. They get ts = 0 so they sort as the oldest marks.
+    """
+    conn.execute("UPDATE attendance SET ts = 0 WHERE ts IS NULL")
+
+# (schema version, migration) in order; PRAGMA user_version records the last one applied
+SCHEMA_MIGRATIONS = [
+    (1, _create_tables),
+    (2, _add_sessions_and_timestamps),
+    (3, _add_outbox),
+    (4, _add_aggregates),
+    (5, _add_session_camera),
+    (6, _add_outbox_lease),
+    (7, _fill_missing_ts),
+]
+
+def migrate_db():
+    """Brings attendance.db up to the latest schema version in place. Safe to call on every start."""
+    def migrate(conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        applied = []
+        for target, migration in SCHEMA_MIGRATIONS:
+            if version < target:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+                version = target
+                applied.append(target)
+        return applied
+
+    applied = db.write(migrate)
+    if applied:
+        print(f"Database migrated to schema version {applied[-1]}.")
+
+def start_session(name, camera_id=None):
+    """Records a new attendance session and returns its id."""
+    return db.write(lambda conn: conn.execute(
+        "INSERT INTO sessions (name, started_ts, camera_id) VALUES (?, ?, ?)", (name, time.time(), camera_id)).lastrowid)
+
+def end_session(session_id):
+    db.write(lambda conn: conn.execute(
+        "UPDATE sessions SET ended_ts = ? WHERE id = ? AND ended_ts IS NULL", (time.time(), session_id)))
+
+EXCEL_HEADER = ["Student ID", "Name", "Date", "Time", "Status"]
+EXCEL_FLUSH_INTERVAL = 10.0 # Seconds between Excel log flushes
+EXCEL_FLUSH_BATCH = 50 # ...or flush as soon as this many marks are waiting
+EXPORTED_PROPERTY = "last_attendance_id" # Workbook property: newest attendance row already in the log
+
+
+class ExcelLogWriter(threading.Thread):
+    """
+    Appends attendance rows to a daily Excel log (Attendance_Log_YYYY-MM-DD.xlsx)
+    off the recognition thread.
+
+    openpyxl can only save a whole workbook, so every flush rewrites the file it
+    appends to. Rotating by day bounds that cost (and the memory of the cached
+    workbook) by one day's marks instead of the whole history. The single
+    Attendance_Log.xlsx written by older versions is left as it is.
+
+    Marks only wake the writer up; each flush appends every attendance row
+    newer than the last one exported. That row id is kept in a small state
+    file, and each day's workbook also stores the newest row it holds (saved
+    atomically with the rows), so marks made before a crash, while a file was
+    open in Excel, or while the app was down are caught up on the next flush
+    instead of being lost or duplicated.
+    """
+
+    def __init__(self, path=EXCEL_FILE, interval=EXCEL_FLUSH_INTERVAL, batch=EXCEL_FLUSH_BATCH):
+        super().__init__(name="ExcelLogWriter", daemon=True)
+        self.path = path # Legacy single log; the daily logs are named after it
+        self.state_path = os.path.splitext(path)[0] + ".state.json"
+        self.interval = interval
+        self.batch = batch
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = 0
+        self._stopping = False
+        self._book = None # Cached workbook of the last day written, reloaded only if the file changes underneath us
+        self._book_path = None
+        self._mtime = None
+        self.last_id = None
+        self.rows_written = 0
+        self.flushes = 0
+
+    def notify(self):
+        with self._cond:
+            self._pending += 1
+            if self._pending >= self.batch:
+                self._cond.notify_all()
+
+    def run(self):
+        self.flush() # Catch up with marks made since the last run
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopping or self._pending >= self.batch, self.interval)
+                stopping = self._stopping
+                pending, self._pending = self._pending, 0
+            if pending:
+                self.flush()
+            if stopping:
+                return
+
+    def stop(self):
+        """Flushes whatever is left; called on shutdown."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join(timeout=30)
+        self.flush()
+
+    def day_path(self, day):
+        base, ext = os.path.splitext(self.path)
+        return f"{base}_{day}{ext}"
+
+    def _new_book(self, path):
+        book = Workbook()
+        sheet = book.active
+        sheet.title = "Sheet1"
+        sheet.append(EXCEL_HEADER)
+        # Format Header
+        header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+        header_font = Font(color="FFFFFF", bold=True)
+        for cell in sheet[1]:
+            cell.fill = header_fill
+            cell.font = header_font
+        book.custom_doc_props.append(IntProperty(name=EXPORTED_PROPERTY, value=0))
+        print(f"Created new Excel file: {path}")
+        return book
+
+    def _open_book(self, path):
+        if not os.path.exists(path):
+            return self._new_book(path)
+        mtime = os.path.getmtime(path)
+        if self._book is None or path != self._book_path or mtime != self._mtime:
+            self._book = load_workbook(path)
+            self._book_path, self._mtime = path, mtime
+        return self._book
+
+    def _exported_id(self):
+        if self.last_id is not None:
+            return self.last_id
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as f:
+                return int(json.load(f)[EXPORTED_PROPERTY])
+        if not os.path.exists(self.path):
+            return 0
+        # First run after the single-file log: carry on from where it stopped
+        legacy = load_workbook(self.path, read_only=True)
+        if EXPORTED_PROPERTY in legacy.custom_doc_props.names:
+            return int(legacy.custom_doc_props[EXPORTED_PROPERTY].value)
+        # Written by the old synchronous writer: it is already up to date
+        return db.read("SELECT COALESCE(MAX(id), 0) FROM attendance")[0][0]
+
+    def _save_state(self, last_id):
+        tmp_path = f"{self.state_path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({EXPORTED_PROPERTY: last_id}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _append(self, path, rows):
+        """Appends rows the day's workbook doesn't hold yet; returns how many."""
+        book = self._open_book(path)
+        if EXPORTED_PROPERTY not in book.custom_doc_props.names:
+            book.custom_doc_props.append(IntProperty(name=EXPORTED_PROPERTY, value=0))
+        held = int(book.custom_doc_props[EXPORTED_PROPERTY].value)
+        rows = [row for row in rows if row[0] > held] # Already saved here if the state file lagged behind
+        if not rows:
+            return 0
+        sheet = book.active
+        for row in rows:
+            sheet.append([row[1], row[2], row[3], row[4], "Present"])
+        book.custom_doc_props[EXPORTED_PROPERTY].value = rows[-1][0]
+
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        book.save(tmp_path)
+        os.replace(tmp_path, path)
+        self._book, self._book_path, self._mtime = book, path, os.path.getmtime(path)
+        return len(rows)
+
+    def flush(self):
+        with self._flush_lock:
+            try:
+                last_id = self._exported_id()
+                rows = db.read("SELECT id, student_id, name, date, time FROM attendance WHERE id > ? ORDER BY id",
+                               (last_id,))
+                by_day = {}
+                for row in rows:
+                    try:
+                        day = datetime.strptime(row[3], "%Y-%m-%d").strftime("%Y-%m-%d")
+                    except (TypeError, ValueError):
+                        day = "undated" # Legacy rows with an unreadable date
+                    by_day.setdefault(day, []).append(row)
+                written = sum(self._append(self.day_path(day), day_rows) for day, day_rows in by_day.items())
+                if rows:
+                    last_id = rows[-1][0]
+                    self._save_state(last_id)
+                    self.flushes += 1
+                    self.rows_written += written
+                    print(f"Logged {written} mark(s) to Excel")
+                self.last_id = last_id
+            except Exception as e:
+                # Rows stay pending (the exported id didn't move) and go out with the next flush
+                self._book = None
+                print(f"Error logging to Excel: {e}")
+
+    def stats(self):
+        with self._cond:
+            pending = self._pending
+        return {"pending": pending, "rows_written": self.rows_written, "flushes": self.flushes, "last_id": self.last_id,
+                "file": self._book_path}
+
+
+excel_log = ExcelLogWriter()
 
 def init_excel():
-    if not os.path.exists(EXCEL_FILE):
-        df = pd.DataFrame(columns=["Student ID", "Name", "Date", "Time", "Status"])
-        with pd.ExcelWriter(EXCEL_FILE, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Sheet1')
-            worksheet = writer.sheets['Sheet1']
-            # Format Header
-            header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-            header_font = Font(color="FFFFFF", bold=True)
-            for cell in worksheet[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-        print(f"Created new Excel file: {EXCEL_FILE}")
-
-def log_to_excel(student_id, name, date_str, time_str):
-    try:
-        new_entry = pd.DataFrame([{
-            "Student ID": student_id,
-            "Name": name,
-            "Date": date_str,
-            "Time": time_str,
-            "Status": "Present"
-        }])
-        
-        # Append to Excel
-        if os.path.exists(EXCEL_FILE):
-            with pd.ExcelWriter(EXCEL_FILE, mode='a', engine='openpyxl', if_sheet_exists='overlay') as writer:
-                # Load existing sheet to find next empty row
-                try:
-                    writer.book = pd.read_excel(EXCEL_FILE, engine='openpyxl') # Load to check
-                    start_row = writer.book.shape[0] + 1
-                except:
-                    start_row = 0
-                
-                # We actually just want to append using pandas functionality if possible, 
-                # but pandas append is deprecated.
-                # Simpler way: Read, Append, Write back (Inefficient for huge data but fine here)
+    """Starts the Excel log writer (creates the workbook on its first flush)."""
+    if not excel_log.is_alive() and not excel_log._stopping:
+        excel_log.start()
+        atexit.register(excel_log.stop)
+
+JOURNAL_FILE = os.path.join(DB_FOLDER, "pending_marks.journal")
+# What a queued mark survives before it is committed. The writer thread journals
+# each batch before committing it, so only marks from the last GROUP_COMMIT_WINDOW
+# (not yet picked up by the writer) are lost in any mode:
+#   "fsync" - journal synced to disk per batch (power loss)
+#   "flush" - journal handed to the OS per batch (app crash, not power loss)
+#   "off"   - no journal (marks still queued are lost if the app dies)
+JOURNAL_MODE = "fsync"
+REJECTED_MARKS_FILE = os.path.join(DB_FOLDER, "rejected_marks.jsonl") # Marks the database refused, with the error
+WRITE_QUEUE_SIZE = 1000 # Marks waiting for the writer; beyond this marks are written inline
+WRITE_BATCH = 100 # Max marks per group commit
+GROUP_COMMIT_WINDOW = 0.05 # Seconds the writer waits for more marks before committing a batch
+READ_FLUSH_TIMEOUT = 0.2 # Seconds a read waits for queued marks to land (never while the writer is backing off)
+
+
+def _store_marks(conn, records):
+    """Inserts (student_id, name, date, time, ts, session_id) records and updates the aggregates."""
+    conn.executemany(SQL_INSERT_MARK, records)
+    conn.executemany(SQL_UPSERT_SESSION_AGG, [(r[5], r[0], r[1], r[4], r[4]) for r in records if r[5] is not None])
+    conn.executemany(SQL_UPSERT_DAILY_AGG, [(r[2], r[0], r[1], r[4], r[4]) for r in records])
+
+def _insert_marks(records):
+    """Stores marks in one transaction."""
+    db.write(lambda conn: _store_marks(conn, records))
+    for student_id, name, _, time_str, _, _ in records:
+        print(f"Marked attendance for {name} ({student_id}) at {time_str}")
+        # Append to Excel Log (batched, see ExcelLogWriter)
+        excel_log.notify()
+
+
+class AttendanceWriter(threading.Thread):
+    """
+    Write-behind persistence for attendance marks, so the recognition thread
+    never waits on SQLite or the disk: submit() only appends to a queue. This
+    thread takes marks in groups, journals them (see JOURNAL_MODE) and then
+    commits them, so a batch stuck on a locked database survives a crash. The
+    journal is emptied whenever everything journaled has been committed and
+    is replayed on start, skipping marks that already made it into the database.
+
+    Only lock and I/O errors are retried (with backoff). A batch refused for
+    any other reason (e.g. a constraint) is retried one mark at a time, and
+    marks that still fail are moved to REJECTED_MARKS_FILE instead of
+    blocking the queue forever.
+    """
+
+    def __init__(self, journal_path=JOURNAL_FILE, journal_mode=JOURNAL_MODE, capacity=WRITE_QUEUE_SIZE,
+                 batch=WRITE_BATCH, window=GROUP_COMMIT_WINDOW, rejected_path=REJECTED_MARKS_FILE):
+        super().__init__(name="AttendanceWriter", daemon=True)
+        self.journal_path = journal_path
+        self.rejected_path = rejected_path
+        self.journal_mode = journal_mode
+        self.capacity = capacity
+        self.batch = batch
+        self.window = window
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._journaled = 0 # Marks at the front of the queue that are already in the journal
+        self._inflight = 0
+        self._backing_off = False # The last commit failed and the writer is waiting to retry
+        self._stopping = False
+        self._journal = None
+        # Metrics
+        self.committed = 0
+        self.batches = 0
+        self.overflows = 0
+        self.failures = 0
+        self.rejected = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+    def start(self):
+        """Replays the journal left by a previous run, then starts writing."""
+        self._replay()
+        if self.journal_mode != "off":
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        super().start()
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return
+        records = []
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
                 try:
-                     df_existing = pd.read_excel(EXCEL_FILE)
+                    records.append(tuple(json.loads(line)))
                 except ValueError:
-                     # Sheet might be empty or file corrupt
-                     df_existing = pd.DataFrame(columns=["Student ID", "Name", "Date", "Time", "Status"])
-
-                # Check if this student is already marked within last 3 minutes
-                if not df_existing.empty:
-                    student_rows = df_existing[df_existing['Student ID'].astype(str) == str(student_id)]
-                    if not student_rows.empty:
-                        last_row = student_rows.iloc[-1]
-                        last_date = str(last_row['Date'])
-                        last_time = str(last_row['Time'])
-                        try:
-                            last_dt = datetime.strptime(f"{last_date} {last_time}", "%Y-%m-%d %H:%M:%S")
-                            current_dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S")
-                            if (current_dt - last_dt) < timedelta(minutes=3):
-                                 print(f"Skipping Excel log: {name} marked recently.")
-                                 return
-                        except ValueError:
-                            pass
-
-                df_combined = pd.concat([df_existing, new_entry], ignore_index=True)
-                
-                with pd.ExcelWriter(EXCEL_FILE, engine='openpyxl', mode='w') as writer_new:
-                     df_combined.to_excel(writer_new, index=False)
-                     # Re-apply header styles
-                     worksheet = writer_new.sheets['Sheet1']
-                     header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-                     header_font = Font(color="FFFFFF", bold=True)
-                     for cell in worksheet[1]:
-                        cell.fill = header_fill
-                        cell.font = header_font
-                     
-    except Exception as e:
-        print(f"Error logging to Excel: {e}")
+                    pass # Torn last line from a crash mid-write
+        missing = [r for r in records if not db.read(
+            "SELECT 1 FROM attendance WHERE student_id = ? AND ts = ?", (r[0], r[4]))]
+        stored, retry = self._commit(missing)
+        if missing:
+            print(f"Recovered {stored} unsaved mark(s) from {self.journal_path}")
+        if retry:
+            self._queue.extend(retry) # Still journaled; the journal is emptied once they are committed
+            self._journaled = len(retry)
+        else:
+            os.remove(self.journal_path)
 
-        print(f"Logged to Excel: {name}")
-    except Exception as e:
-        print(f"Error logging to Excel: {e}")
+    def submit(self, record):
+        """Queues a mark. Returns False if the writer isn't running or is full (caller writes it inline)."""
+        with self._cond:
+            if not self.is_alive() or self._stopping or len(self._queue) >= self.capacity:
+                self.overflows += 1
+                return False
+            self._queue.append(record)
+            self._cond.notify_all()
+            return True
+
+    def run(self):
+        delay = 0.5
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._stopping)
+                if not self._queue:
+                    return
+                # Group commit: give marks arriving together a moment to join the batch
+                self._cond.wait_for(lambda: len(self._queue) >= self.batch or self._stopping, self.window)
+                fresh = list(self._queue)[self._journaled:]
+
+            # Journal outside the lock, so submit() never waits for the disk
+            self._write_journal(fresh)
+
+            with self._cond:
+                self._journaled += len(fresh)
+                records = [self._queue.popleft() for _ in range(min(self.batch, self._journaled))]
+                self._journaled -= len(records)
+                self._inflight = len(records)
+
+            start = time.perf_counter()
+            stored, retry = self._commit(records)
+            latency = time.perf_counter() - start
+            ok = not retry
+
+            with self._cond:
+                self._inflight = 0
+                self.committed += stored
+                self._backing_off = not ok
+                if ok:
+                    delay = 0.5
+                    self.batches += 1
+                    self.last_latency = latency
+                    self.max_latency = max(self.max_latency, latency)
+                    self._total_latency += latency
+                    if not self._journaled and self._journal:
+                        self._journal.truncate(0) # Everything journaled is in the database
+                else:
+                    self.failures += 1
+                    self._queue.extendleft(reversed(retry))
+                    self._journaled += len(retry)
+                self._cond.notify_all()
+            if not ok:
+                if self._stopping:
+                    return # Left in the journal for the next start
+                time.sleep(delay)
+                delay = min(delay * 2, 10.0)
 
-def mark_attendance(student_id, name):
+    def _write_journal(self, records):
+        if not records or not self._journal:
+            return
+        try:
+            self._journal.write("".join(json.dumps(record) + "\n" for record in records))
+            self._journal.flush()
+            if self.journal_mode == "fsync":
+                os.fsync(self._journal.fileno())
+        except OSError as e:
+            print(f"Could not journal {len(records)} mark(s), committing them anyway: {e}")
+
+    def _commit(self, records):
+        """
+        Stores records. Returns (number stored, records to retry later); only a
+        lock or I/O error leaves records to retry, anything else rejects the
+        offending marks one by one.
+        """
+        if not records:
+            return 0, []
+        try:
+            _insert_marks(records)
+            return len(records), []
+        except Exception as e:
+            if _is_transient(e):
+                print(f"Error saving attendance (will retry): {e}")
+                return 0, records
+            print(f"Batch of {len(records)} mark(s) refused ({e}), saving them one by one...")
+
+        stored = 0
+        for i, record in enumerate(records):
+            try:
+                _insert_marks([record])
+                stored += 1
+            except Exception as e:
+                if _is_transient(e):
+                    print(f"Error saving attendance (will retry): {e}")
+                    return stored, records[i:]
+                self._reject(record, e)
+        return stored, []
+
+    def _reject(self, record, error):
+        print(f"Rejected attendance mark for {record[1]} ({record[0]}): {error}")
+        try:
+            with open(self.rejected_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"record": record, "error": str(error), "rejected_ts": time.time()}) + "\n")
+        except OSError as e:
+            print(f"Could not write {self.rejected_path}: {e}")
+        with self._cond:
+            self.rejected += 1
+
+    def flush(self, timeout=10.0, wait_while_failing=True):
+        """
+        Waits until every queued mark is committed (e.g. before building a report).
+        With wait_while_failing=False it returns at once while the writer is backing
+        off after a failed commit. Returns True if nothing is left in the queue.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._queue and not self._inflight
+                                or (self._backing_off and not wait_while_failing), timeout)
+            return not self._queue and not self._inflight
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join(timeout=30)
+        if self._journal:
+            self._journal.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._queue) + self._inflight,
+                "committed": self.committed,
+                "batches": self.batches,
+                "avg_batch": round(self.committed / self.batches, 2) if self.batches else 0,
+                "commit_latency_ms": {
+                    "last": round(self.last_latency * 1000, 2),
+                    "avg": round(self._total_latency / self.batches * 1000, 2) if self.batches else 0,
+                    "max": round(self.max_latency * 1000, 2),
+                },
+                "inline_writes": self.overflows,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "journal": self.journal_mode,
+            }
+
+
+attendance_writer = AttendanceWriter()
+
+def mark_attendance(student_id, name, session_id=None):
+    """
+    Records a mark unless the student was already marked in this session within
+    MARK_COOLDOWN. Returns True if the student is now marked for the session
+    (just now or within the cooldown), False if the mark could not be stored.
+    """
     now = datetime.now()
+    now_ts = now.timestamp()
     date_str = now.strftime("%Y-%m-%d")
     time_str = now.strftime("%H:%M:%S")
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+
+    # Check if already marked within the last 3 minutes (in memory, see CooldownCache)
+    allowed, since = cooldown.reserve(student_id, now_ts, session_id)
+    if not allowed:
+        print(f"Attendance already marked for {name} recently ({timedelta(seconds=int(since))}).")
+        return True
+
+    record = (student_id, name, date_str, time_str, now_ts, session_id)
+    if attendance_writer.submit(record):
+        return True
     try:
-        # Check if already marked within the last 3 minutes
-        cursor.execute("SELECT date, time FROM attendance WHERE student_id = ? ORDER BY id DESC LIMIT 1", (student_id,))
-        last_record = cursor.fetchone()
-        
-        if last_record:
-            last_date_str, last_time_str = last_record
-            try:
-                last_dt = datetime.strptime(f"{last_date_str} {last_time_str}", "%Y-%m-%d %H:%M:%S")
-                if (now - last_dt) < timedelta(minutes=3):
-                    print(f"Attendance already marked for {name} recently ({now - last_dt}).")
-                    return
-            except ValueError:
-                pass # Ignore parsing errors, just mark new attendance
-
-        cursor.execute('''
-            INSERT INTO attendance (student_id, name, date, time)
-            VALUES (?, ?, ?, ?)
-        ''', (student_id, name, date_str, time_str))
-        conn.commit()
-        print(f"Marked attendance for {name} ({student_id}) at {time_str}")
-        
-        # Append to Excel Log (Check for duplicates first)
-        log_to_excel(student_id, name, date_str, time_str)
-        
-    except sqlite3.IntegrityError:
-        # print(f"Attendance already marked for {name} today.")
-        pass
-    finally:
-        conn.close()
-
-def get_attendance_records():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM attendance ORDER BY date DESC, time DESC")
-    records = cursor.fetchall()
-    conn.close()
-    return records
+        _insert_marks([record])
+        return True
+    except Exception as e:
+        # Free the cooldown so the next sighting of the student tries again
+        print(f"Error saving attendance for {name} ({student_id}): {e}")
+        cooldown.release(student_id, now_ts, session_id)
+        return False
 
-def generate_session_report(session_start_time, session_name="Session"):
+ATTENDANCE_PAGE_SIZE = 50
+ATTENDANCE_COLUMNS = ["id", "student_id", "name", "date", "time", "ts", "session_id"]
+
+def encode_cursor(row):
+    """Keyset cursor for the page after `row` (an attendance row from query_attendance)."""
+    return f"{row[5]!r}:{row[0]}"
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    ts, row_id = cursor.split(":")
+    return float(ts), int(row_id)
+
+def query_attendance(date=None, student_id=None, session_id=None, cursor=None, limit=ATTENDANCE_PAGE_SIZE):
     """
-    Generates a formatted Excel report for the current session (records > session_start_time).
+    Newest-first attendance rows, filtered in SQL and paginated by keyset on (ts, id),
+    so every page is an index range scan no matter how large the table is.
+    `date` is YYYY-MM-DD (local). Pass the returned cursor back to get the next page.
+    Returns: (rows, next_cursor or None). Rows are ordered like ATTENDANCE_COLUMNS.
+    """
+    attendance_writer.flush(READ_FLUSH_TIMEOUT, wait_while_failing=False) # Reads never queue behind a failing writer
+    clauses, params = [], []
+    if date:
+        day_start = datetime.strptime(date, "%Y-%m-%d")
+        clauses.append("ts >= ? AND ts < ?")
+        params += [day_start.timestamp(), (day_start + timedelta(days=1)).timestamp()]
+    if student_id:
+        clauses.append("student_id = ?")
+        params.append(student_id)
+    if session_id is not None:
+        clauses.append("session_id = ?")
+        params.append(session_id)
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        # The redundant `ts <= ?` lets SQLite seek into the index instead of scanning from the top
+        clauses.append("ts <= ? AND (ts < ? OR id < ?)")
+        params += [ts, ts, row_id]
+
+    sql = f"SELECT {', '.join(ATTENDANCE_COLUMNS)} FROM attendance"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY ts DESC, id DESC"
+    if limit is None:
+        return db.read(sql, params), None
+
+    # One extra row tells us whether there is a next page
+    rows = db.read(sql + " LIMIT ?", params + [limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+def get_sessions(limit=50):
+    """Most recent sessions as (id, name, started_ts, ended_ts, camera_id)."""
+    return db.read("SELECT id, name, started_ts, ended_ts, camera_id FROM sessions ORDER BY id DESC LIMIT ?", (limit,))
+
+REPORT_FORMAT = "xlsx" # Session report format: "xlsx" or "csv"
+REPORT_HEADER = ["Student ID", "Name", "Date", "Time", "Status", "Session"]
+
+def generate_session_report(session_start_time, session_name="Session", session_id=None, fmt=REPORT_FORMAT):
+    """
+    Generates a formatted Excel (or CSV) report for the current session (records of `session_id`,
+    or records since session_start_time for sessions started before session ids existed).
+    Rows are streamed from SQLite straight into the file, so memory stays flat however big the session.
     Returns: (file_path, summary_text, unique_attendees_list)
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Filter by date and time
-    start_date = session_start_time.strftime("%Y-%m-%d")
-    start_time_str = session_start_time.strftime("%H:%M:%S")
-    
-    # Get records from DB that match the date and are after the start time
-    # Note: This simple comparison works if the session doesn't cross midnight
-    cursor.execute('''
-        SELECT student_id, name, date, time 
-        FROM attendance 
-        WHERE date = ? AND time >= ?
-        ORDER BY time ASC
-    ''', (start_date, start_time_str))
-    
-    rows = cursor.fetchall()
-    conn.close()
+    attendance_writer.flush() # Include marks still in the write-behind queue
+
+    # Distinct students, first mark each
+    if session_id is not None:
+        # Straight from the per-session aggregate
+        first_marks = '''
+            SELECT student_id, name, date(first_ts, 'unixepoch', 'localtime') AS date,
+                   time(first_ts, 'unixepoch', 'localtime') AS time, first_ts
+            FROM session_attendance
+            WHERE session_id = ?
+        '''
+        params = (session_id,)
+    else:
+        # Sessions without an id: group the raw marks (SQLite takes the bare columns from the MIN(ts) row)
+        first_marks = '''
+            SELECT student_id, name, date, time, MIN(ts) AS first_ts
+            FROM attendance
+            WHERE ts >= ?
+            GROUP BY student_id
+        '''
+        params = (session_start_time.timestamp(),)
+    # Pre-pass for the row count and column widths (write-only sheets need widths before any row)
+    count, id_width, name_width = db.read(f'''
+        SELECT COUNT(*), MAX(LENGTH(student_id)), MAX(LENGTH(name)) FROM ({first_marks})
+    ''', params)[0]
     
-    if not rows:
+    if not count:
         return None, "No attendance recorded in this session.", []
-        
-    # Filter distinct students (keep first occurrence per session)
-    seen_ids = set()
-    unique_rows = []
-    unique_attendees = [] # List of (name, id, time) for WhatsApp
-    
-    for row in rows:
-        student_id = row[0]
-        if student_id not in seen_ids:
-            seen_ids.add(student_id)
-            unique_rows.append(row)
-            unique_attendees.append((row[1], row[0], row[3])) # name, id, time
             
-    # Create DataFrame
-    df = pd.DataFrame(unique_rows, columns=["Student ID", "Name", "Date", "Time"])
-    df["Status"] = "Present"
-    df["Session"] = session_name
-    
     # Generate Filename
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     clean_session_name = "".join(c for c in session_name if c.isalnum() or c in (' ', '_', '-')).strip().replace(' ', '_')
-    filename = f"Attendance_{clean_session_name}_{timestamp}.xlsx"
+    filename = f"Attendance_{clean_session_name}_{timestamp}.{fmt}"
     file_path = os.path.join(DB_FOLDER, filename)
-    
-    # Write to Excel with Formatting
-    with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Report')
-        worksheet = writer.sheets['Report']
-        
+
+    unique_attendees = [] # List of (name, id, time) for WhatsApp
+    rows = db.stream(f"{first_marks} ORDER BY first_ts", params)
+
+    if fmt == "csv":
+        with open(file_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_HEADER)
+            for student_id, name, date_str, time_str, _ in rows:
+                writer.writerow([student_id, name, date_str, time_str, "Present", session_name])
+                unique_attendees.append((name, student_id, time_str))
+    else:
+        book = Workbook(write_only=True)
+        worksheet = book.create_sheet("Report")
+
+        # Auto-adjust column width (header or longest value, like the old per-cell scan)
+        data_widths = [id_width, name_width, len("YYYY-MM-DD"), len("HH:MM:SS"), len("Present"), len(session_name)]
+        for i, (title, width) in enumerate(zip(REPORT_HEADER, data_widths)):
+            worksheet.column_dimensions[get_column_letter(i + 1)].width = max(len(title), width or 0) + 2
+
         # Styles
         header_fill = PatternFill(start_color="1F4E78", end_color="1F4E78", fill_type="solid") # Dark Blue
         header_font = Font(color="FFFFFF", bold=True, size=12)
-        row_font = Font(size=11)
-        
-        # Apply Header Style
-        for cell in worksheet[1]:
+        header = []
+        for title in REPORT_HEADER:
+            cell = WriteOnlyCell(worksheet, value=title)
             cell.fill = header_fill
             cell.font = header_font
+            header.append(cell)
+        worksheet.append(header)
+
+        for student_id, name, date_str, time_str, _ in rows:
+            worksheet.append([student_id, name, date_str, time_str, "Present", session_name])
+            unique_attendees.append((name, student_id, time_str))
+        book.save(file_path)
             
-        # Auto-adjust column width
-        for column in worksheet.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            worksheet.column_dimensions[column[0].column_letter].width = adjusted_width
-            
-    summary = f"Session Report: {len(unique_rows)} students present.\nSaved to: {filename}"
+    summary = f"Session Report: {count} students present.\nSaved to: {filename}"
     return file_path, summary, unique_attendees
 
 
+def backfill_aggregates():
+    """Rebuilds session_attendance / daily_attendance from the raw marks."""
+    attendance_writer.flush()
+    db.write(_rebuild_aggregates)
+    sessions, days = db.read("SELECT (SELECT COUNT(*) FROM session_attendance), (SELECT COUNT(*) FROM daily_attendance)")[0]
+    print(f"Aggregates rebuilt: {sessions} session rows, {days} daily rows.")
+
+def get_session_summary(session_id, enrolled=None):
+    """Present count, total marks and time span of a session; `percent` if the enrolled count is given."""
+    attendance_writer.flush(READ_FLUSH_TIMEOUT, wait_while_failing=False)
+    present, marks, first_ts, last_ts = db.read('''
+        SELECT COUNT(*), COALESCE(SUM(hits), 0), MIN(first_ts), MAX(last_ts)
+        FROM session_attendance WHERE session_id = ?
+    ''', (session_id,))[0]
+    summary = {"session_id": session_id, "present": present, "marks": marks, "first_ts": first_ts, "last_ts": last_ts}
+    if enrolled:
+        summary["enrolled"] = enrolled
+        summary["percent"] = round(100.0 * present / enrolled, 1)
+    return summary
+
+def get_day_attendance(day):
+    """One row per student present on `day` (YYYY-MM-DD): (student_id, name, first_ts, last_ts, hits), earliest first."""
+    attendance_writer.flush(READ_FLUSH_TIMEOUT, wait_while_failing=False)
+    return db.read('''
+        SELECT student_id, name, first_ts, last_ts, hits FROM daily_attendance
+        WHERE day = ? ORDER BY first_ts
+    ''', (day,))
+
+def get_student_history(student_id, limit=50):
+    """Sessions a student attended, newest first: (session_id, session name, first_ts, last_ts, hits)."""
+    attendance_writer.flush(READ_FLUSH_TIMEOUT, wait_while_failing=False)
+    return db.read('''
+        SELECT a.session_id, s.name, a.first_ts, a.last_ts, a.hits
+        FROM session_attendance a JOIN sessions s ON s.id = a.session_id
+        WHERE a.student_id = ? ORDER BY a.first_ts DESC LIMIT ?
+    ''', (student_id, limit))
+
+
 if __name__ == "__main__":
+    import sys
     init_db()
+    if "--backfill" in sys.argv:
+        backfill_aggregates()
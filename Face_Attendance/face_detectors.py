@@ -0,0 +1,180 @@
+import os
+import threading
+import cv2
+import numpy as np
+import face_recognition
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+# OpenCV's ResNet-10 SSD face detector (deploy.prototxt + weights from the opencv samples / opencv_3rdparty repo)
+DNN_PROTOTXT = os.path.join(MODELS_DIR, "deploy.prototxt")
+DNN_WEIGHTS = os.path.join(MODELS_DIR, "res10_300x300_ssd_iter_140000.caffemodel")
+DNN_CONFIDENCE = 0.5
+MTCNN_CONFIDENCE = 0.9
+HAAR_CASCADE = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+CASCADE_MARGIN = 0.3 # Proposals are grown by this fraction on each side before confirming
+CASCADE_MIN_CROP = 120 # Crops smaller than this (px) are upscaled so the confirmer can still see the face
+
+# Every detector is called as detect(rgb) and returns face_recognition style
+# boxes: [(top, right, bottom, left), ...] in the coordinates of `rgb`.
+
+
+def _clip(box, height, width):
+    top, right, bottom, left = box
+    return (max(int(top), 0), min(int(right), width), min(int(bottom), height), max(int(left), 0))
+
+
+class HogDetector:
+    """dlib HOG via face_recognition (what the app always used)."""
+    name = "hog"
+
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+
+    def __call__(self, rgb):
+        return face_recognition.face_locations(rgb, self.upsample, model="hog")
+
+
+class HaarDetector:
+    """OpenCV Haar cascade: very cheap, but more false positives and misses on turned faces."""
+    name = "haar"
+
+    def __init__(self, scale_factor=1.1, min_neighbors=5, min_size=24):
+        self.cascade = cv2.CascadeClassifier(HAAR_CASCADE)
+        if self.cascade.empty():
+            raise FileNotFoundError(f"Haar cascade not found: {HAAR_CASCADE}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = (min_size, min_size)
+
+    def __call__(self, rgb):
+        gray = cv2.equalizeHist(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY))
+        faces = self.cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors, minSize=self.min_size)
+        return [(y, x + w, y + h, x) for x, y, w, h in faces]
+
+
+class DnnDetector:
+    """OpenCV DNN ResNet-10 SSD: accurate and fast on CPU, needs the model files in models/."""
+    name = "dnn"
+
+    def __init__(self, confidence=DNN_CONFIDENCE):
+        for path in (DNN_PROTOTXT, DNN_WEIGHTS):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"DNN face model missing: {path}")
+        self.net = cv2.dnn.readNetFromCaffe(DNN_PROTOTXT, DNN_WEIGHTS)
+        self._lock = threading.Lock() # setInput/forward share the net's state, so one frame at a time
+        self.confidence = confidence
+
+    def __call__(self, rgb):
+        height, width = rgb.shape[:2]
+        # The Caffe model was trained on BGR input with BGR means (104, 177, 123)
+        bgr = cv2.cvtColor(cv2.resize(rgb, (300, 300)), cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(bgr, 1.0, (300, 300), (104.0, 177.0, 123.0), swapRB=False)
+        with self._lock:
+            self.net.setInput(blob)
+            detections = self.net.forward()[0, 0]
+        boxes = []
+        for _, _, score, x1, y1, x2, y2 in detections:
+            if score < self.confidence:
+                continue
+            boxes.append(_clip((y1 * height, x2 * width, y2 * height, x1 * width), height, width))
+        return [box for box in boxes if box[2] > box[0] and box[1] > box[3]]
+
+
+class MtcnnDetector:
+    """facenet-pytorch MTCNN (the detector train_pt.py uses): best on small and turned faces, slowest."""
+    name = "mtcnn"
+
+    def __init__(self, confidence=MTCNN_CONFIDENCE, min_face_size=20):
+        import torch
+        from facenet_pytorch import MTCNN
+        device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+        self.mtcnn = MTCNN(keep_all=True, min_face_size=min_face_size, device=device)
+        self.confidence = confidence
+
+    def __call__(self, rgb):
+        height, width = rgb.shape[:2]
+        boxes, probs = self.mtcnn.detect(rgb)
+        if boxes is None:
+            return []
+        return [_clip((y1, x2, y2, x1), height, width)
+                for (x1, y1, x2, y2), p in zip(boxes, probs) if p >= self.confidence]
+
+
+class CascadeDetector:
+    """
+    Cheap detector proposes, expensive detector confirms.
+
+    The expensive detector only sees a crop around each proposal (grown by
+    CASCADE_MARGIN), so on an empty frame it does not run at all and on a busy
+    frame it runs on a few small crops instead of the whole image. Boxes the
+    confirmer finds are mapped back to frame coordinates.
+    """
+
+    def __init__(self, proposer, confirmer, margin=CASCADE_MARGIN):
+        self.proposer = proposer
+        self.confirmer = confirmer
+        self.margin = margin
+        self.name = f"{proposer.name}>{confirmer.name}"
+        self._lock = threading.Lock()
+        self.proposals = 0
+        self.confirmed = 0
+
+    def __call__(self, rgb):
+        height, width = rgb.shape[:2]
+        proposals = self.proposer(rgb)
+        boxes = []
+        for top, right, bottom, left in proposals:
+            grow_y, grow_x = int((bottom - top) * self.margin), int((right - left) * self.margin)
+            y0, x0 = max(top - grow_y, 0), max(left - grow_x, 0)
+            y1, x1 = min(bottom + grow_y, height), min(right + grow_x, width)
+            crop = rgb[y0:y1, x0:x1]
+            if crop.size == 0:
+                continue
+            scale = max(1.0, CASCADE_MIN_CROP / min(crop.shape[:2]))
+            if scale > 1.0:
+                crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+            for c_top, c_right, c_bottom, c_left in self.confirmer(np.ascontiguousarray(crop)):
+                box = _clip((y0 + c_top / scale, x0 + c_right / scale, y0 + c_bottom / scale, x0 + c_left / scale),
+                            height, width)
+                if not any(_overlaps(box, kept) for kept in boxes): # Overlapping proposals confirm the same face
+                    boxes.append(box)
+        with self._lock:
+            self.proposals += len(proposals)
+            self.confirmed += len(boxes)
+        return boxes
+
+    def stats(self):
+        with self._lock:
+            return {"proposals": self.proposals, "confirmed": self.confirmed}
+
+
+def _overlaps(a, b, threshold=0.5):
+    inter_h = min(a[2], b[2]) - max(a[0], b[0])
+    inter_w = min(a[1], b[1]) - max(a[3], b[3])
+    if inter_h <= 0 or inter_w <= 0:
+        return False
+    inter = inter_h * inter_w
+    area = lambda box: (box[2] - box[0]) * (box[1] - box[3])
+    return inter / float(area(a) + area(b) - inter) >= threshold
+
+
+DETECTORS = {
+    "hog": HogDetector,
+    "haar": HaarDetector,
+    "dnn": DnnDetector,
+    "mtcnn": MtcnnDetector,
+}
+
+
+def make_detector(spec):
+    """
+    Builds a detector from a name ("hog", "haar", "dnn", "mtcnn") or a
+    cascade "proposer>confirmer", e.g. "haar>hog".
+    """
+    if ">" in spec:
+        proposer, confirmer = spec.split(">", 1)
+        return CascadeDetector(make_detector(proposer.strip()), make_detector(confirmer.strip()))
+    if spec not in DETECTORS:
+        raise ValueError(f"Unknown face detector: {spec} (choose from {', '.join(DETECTORS)} or a cascade like haar>hog)")
+    return DETECTORS[spec]()
+
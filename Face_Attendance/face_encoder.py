@@ -1,72 +1,174 @@
 import os
-import pickle
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import dlib
 import face_recognition
+import face_recognition_models
+import numpy as np
 import cv2
+from face_prototypes import compile_prototypes
+from gallery_store import write_gallery, write_manifest, file_fingerprint
+from parallel_encoder import DEFAULT_WORKERS, PARALLEL_MIN_IMAGES, ProgressReporter, Checkpoint
 
 DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset")
-ENCODINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "encodings.pkl")
+ENCODINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "encodings.gallery")
+MANIFEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "encodings.manifest.json")
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "encodings.checkpoint.pkl")
+NUM_JITTERS = 10
+MODEL_TAG = f"dlib-hog-jitter{NUM_JITTERS}" # Stored in the manifest; changing it forces a full re-encode
 
-def generate_encodings():
+# The same 5-point landmark model face_recognition uses for model="small"; loaded once per process
+pose_predictor = dlib.shape_predictor(face_recognition_models.pose_predictor_five_point_model_location())
+
+def _jitter_model():
+    """
+    dlib keeps the jitter random generator inside the model object and offers
+    no way to reseed it, so reusing one object makes every encoding depend on
+    the images encoded before it. A fresh object per image starts from the
+    same seed every time, which keeps serial, parallel and resumed runs
+    identical (loading costs ~0.1s against ~2s for ten jitters).
+    """
+    return dlib.face_recognition_model_v1(face_recognition_models.face_recognition_model_location())
+
+def encode_image(image_path):
+    """Returns the dlib encoding of the first face in an image, or None."""
+    # Read image
+    image = cv2.imread(image_path)
+    if image is None:
+        return None
+
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    # Detect faces
+    boxes = face_recognition.face_locations(rgb_image, model="hog")
+    if not boxes:
+        print(f"No face found in {os.path.basename(image_path)}")
+        return None
+
+    # Same as face_recognition.face_encodings(..., num_jitters=10, model="small")[0], with a per-image jitter generator
+    # num_jitters=10 acts like "echos" to improve accuracy by resampling the face multiple times
+    top, right, bottom, left = boxes[0]
+    landmarks = pose_predictor(rgb_image, dlib.rectangle(left, top, right, bottom))
+    return np.array(_jitter_model().compute_face_descriptor(rgb_image, landmarks, NUM_JITTERS))
+
+def encode_images(items, workers=DEFAULT_WORKERS, reporter=None, checkpoint=None):
+    """
+    Encodes [(key, image_path), ...] and returns {key: encoding or None}.
+    Images that raised an error are left out of the result.
+    Larger batches are spread over a process pool; since every image is encoded
+    independently (see _jitter_model) the result is the same as encoding them
+    one by one.
+    """
+    reporter = reporter or ProgressReporter("dlib", len(items))
+    results = {}
+    todo = []
+    for key, image_path in items:
+        if checkpoint:
+            found, encoding = checkpoint.get(key, image_path)
+            if found:
+                results[key] = encoding
+                reporter.update()
+                continue
+        todo.append((key, image_path))
+
+    def finish(key, image_path, encoding, error=None):
+        if error is not None:
+            print(f"  Error processing {image_path}: {error}")
+        else:
+            results[key] = encoding
+            if checkpoint:
+                checkpoint.record(key, image_path, encoding)
+        reporter.update()
+
+    if workers > 1 and len(todo) >= PARALLEL_MIN_IMAGES:
+        # Spawned workers re-import the caller's __main__ module, so parallel runs are only
+        # for the command-line entry points; the app trains in-process (see TRAIN_WORKERS in app.py)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {pool.submit(encode_image, image_path): (key, image_path) for key, image_path in todo}
+            for future in as_completed(futures):
+                key, image_path = futures[future]
+                try:
+                    finish(key, image_path, future.result())
+                except Exception as e:
+                    finish(key, image_path, None, e)
+    else:
+        for key, image_path in todo:
+            try:
+                finish(key, image_path, encode_image(image_path))
+            except Exception as e:
+                finish(key, image_path, None, e)
+
+    if checkpoint:
+        checkpoint.save()
+    return results
+
+def generate_encodings(workers=DEFAULT_WORKERS):
     known_encodings = []
     known_names = []
     known_ids = []
+    known_paths = []
+    manifest = {}
 
     if not os.path.exists(DATASET_DIR):
         print(f"Error: {DATASET_DIR} directory not found.")
         return
 
     print("Starting face encoding...")
-    
+
+    # Collect images first so they can be encoded in parallel
+    images = []
+
     # Loop through student folders
     for student_folder in os.listdir(DATASET_DIR):
         student_path = os.path.join(DATASET_DIR, student_folder)
-        
+
         if not os.path.isdir(student_path):
             continue
-            
+
         # Parse Folder name: 101_Rahul -> ID: 101, Name: Rahul
         try:
             student_id, student_name = student_folder.split('_', 1)
         except ValueError:
             print(f"Skipping folder {student_folder}: Invalid format. Use ID_Name.")
             continue
-            
+
         print(f"Processing {student_name} ({student_id})...")
-        
+
         # Process images
         for filename in os.listdir(student_path):
             image_path = os.path.join(student_path, filename)
-            
-            # Read image
-            image = cv2.imread(image_path)
-            if image is None:
-                continue
-                
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces
-            boxes = face_recognition.face_locations(rgb_image, model="hog")
-            # num_jitters=10 acts like "echos" to improve accuracy by resampling the face multiple times
-            encodings = face_recognition.face_encodings(rgb_image, boxes, num_jitters=10)
-            
-            if len(encodings) > 0:
-                known_encodings.append(encodings[0])
-                known_names.append(student_name)
-                known_ids.append(student_id)
-            else:
-                print(f"No face found in {filename}")
-
-    # Save encodings
-    data = {
-        "encodings": known_encodings,
-        "names": known_names,
-        "ids": known_ids
-    }
-    
-    with open(ENCODINGS_FILE, "wb") as f:
-        pickle.dump(data, f)
-        
+            images.append((f"{student_folder}/{filename}", image_path, student_id, student_name))
+
+    checkpoint = Checkpoint(CHECKPOINT_FILE, MODEL_TAG)
+    results = encode_images([(rel_path, image_path) for rel_path, image_path, _, _ in images], workers, checkpoint=checkpoint)
+
+    # Assemble in dataset order, exactly as the one-by-one loop did
+    for rel_path, image_path, student_id, student_name in images:
+        if rel_path not in results:
+            continue # Failed to read; left out of the manifest so the next run retries it
+        encoding = results[rel_path]
+        manifest[rel_path] = dict(file_fingerprint(image_path), face=encoding is not None)
+
+        if encoding is not None:
+            known_encodings.append(encoding)
+            known_names.append(student_name)
+            known_ids.append(student_id)
+            known_paths.append(rel_path)
+
+    # Save encodings (atomically swapped in, see gallery_store.py)
+    # Compiled per-student prototypes are stored alongside (optional fast path, see face_prototypes.py)
+    prototypes = compile_prototypes(known_encodings, known_names, known_ids)
+    write_gallery(ENCODINGS_FILE, known_encodings, known_names, known_ids, prototypes, model="dlib", paths=known_paths)
+    # Manifest lets incremental_trainer.py skip unchanged images next time
+    write_manifest(MANIFEST_FILE, MODEL_TAG, manifest)
+    checkpoint.clear()
+
     print(f"Encodings saved to {ENCODINGS_FILE}")
 
 if __name__ == "__main__":
-    generate_encodings()
+    parser = argparse.ArgumentParser(description="Encode every image in dataset/ with dlib.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Encoder processes (1 = serial)")
+    args = parser.parse_args()
+    generate_encodings(args.workers)
@@ -0,0 +1,132 @@
+import numpy as np
+
+# Galleries smaller than this are searched exactly (brute force is faster there)
+AUTO_INDEX_MIN_SIZE = 20000
+
+
+def _sq_norms(x):
+    return np.einsum('ij,ij->i', x, x)
+
+
+def _pairwise_sq_dist(a, b, b_sq_norms=None):
+    if b_sq_norms is None:
+        b_sq_norms = _sq_norms(b)
+    dist = a @ b.T
+    dist *= -2.0
+    dist += _sq_norms(a)[:, None]
+    dist += b_sq_norms[None, :]
+    np.maximum(dist, 0.0, out=dist)
+    return dist
+
+
+def _nearest(x, centroids, chunk=8192):
+    """Index of the closest centroid for every row of x (chunked to bound memory)."""
+    c_sq = _sq_norms(centroids)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        out[start:start + chunk] = np.argmin(_pairwise_sq_dist(x[start:start + chunk], centroids, c_sq), axis=1)
+    return out
+
+
+def kmeans(x, k, iterations=10, seed=0):
+    """Plain Lloyd's k-means in NumPy. Returns (k, dim) float32 centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind='stable')
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        centroids[filled] = np.add.reduceat(x[order], starts, axis=0) / counts[filled, None]
+        # Re-seed empty cells with random points so every list gets used
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+class ExactIndex:
+    """Brute-force search over the whole gallery (default for small rosters)."""
+
+    kind = "exact"
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+
+    def build(self):
+        pass
+
+    def search(self, queries, k):
+        return self.matcher.exact_search(queries, k)
+
+
+class IVFIndex:
+    """
+    Inverted-file index built with NumPy only.
+    The gallery is clustered with k-means into `n_lists` cells and stored
+    cell-by-cell in one contiguous matrix. A query is compared with the
+    centroids first and then only with the vectors of its `n_probe` closest cells.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, matcher, n_lists=None, n_probe=8, iterations=10, train_size=65536, seed=0):
+        self.matcher = matcher
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = None
+
+    def build(self):
+        vectors = self.matcher.vectors
+        n = len(vectors)
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(n)))
+        n_lists = min(n_lists, n)
+
+        rng = np.random.default_rng(self.seed)
+        train = vectors
+        if n > self.train_size:
+            train = vectors[rng.choice(n, self.train_size, replace=False)]
+        self.centroids = kmeans(train, n_lists, self.iterations, self.seed)
+
+        assign = _nearest(vectors, self.centroids)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=n_lists)
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._gallery_index = order
+        self._vectors = np.ascontiguousarray(vectors[order])
+        self._sq_norms = _sq_norms(self._vectors)
+
+    def search(self, queries, k):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.matcher.dim)
+        n_probe = min(self.n_probe, len(self.centroids))
+        cell_dist = _pairwise_sq_dist(queries, self.centroids)
+        probes = np.argpartition(cell_dist, n_probe - 1, axis=1)[:, :n_probe]
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for qi, cells in enumerate(probes):
+            rows = np.concatenate([np.arange(self._offsets[c], self._offsets[c + 1]) for c in cells])
+            if not len(rows):
+                continue
+            dist = _pairwise_sq_dist(queries[qi:qi + 1], self._vectors[rows], self._sq_norms[rows])[0]
+            kk = min(k, len(rows))
+            top = np.argpartition(dist, kk - 1)[:kk] if kk < len(rows) else np.arange(len(rows))
+            top = top[np.argsort(dist[top])]
+            indices[qi, :kk] = self._gallery_index[rows[top]]
+            distances[qi, :kk] = np.sqrt(dist[top])
+        return indices, distances
+
+
+def make_index(kind, matcher):
+    """kind: 'exact', 'ivf' or 'auto' (IVF only once the gallery reaches AUTO_INDEX_MIN_SIZE)."""
+    if kind == "auto":
+        kind = "ivf" if len(matcher) >= AUTO_INDEX_MIN_SIZE else "exact"
+    if kind == "exact":
+        return ExactIndex(matcher)
+    if kind == "ivf":
+        return IVFIndex(matcher)
+    raise ValueError(f"Unknown index backend: {kind}")
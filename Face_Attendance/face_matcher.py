@@ -0,0 +1,157 @@
+import numpy as np
+from face_index import make_index
+from face_prototypes import PrototypeSearch
+
+
+class FaceMatcher:
+    """
+    Nearest-neighbour matcher shared by FaceRecognizer and FaceRecognizerPT.
+
+    The gallery is one preallocated, contiguous float32 matrix (one row per
+    known face) with the squared norms precomputed, so every face in a frame
+    is matched against every known face with a single matrix product:
+        |q - g|^2 = |q|^2 + |g|^2 - 2 q.g
+
+    For very large galleries an approximate index (see face_index.py) can be
+    built on top of the same matrix with build_index(), and a compiled
+    prototype gallery (see face_prototypes.py) can be attached with set_prototypes().
+    """
+
+    def __init__(self, dim, capacity=256):
+        self.dim = dim
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        self.count = 0
+        self.names = []
+        self.ids = []
+        self.index = None
+        self.prototypes = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.count]
+
+    def clear(self):
+        self.count = 0
+        self.names = []
+        self.ids = []
+        self.index = None
+        self.prototypes = None
+
+    def set_prototypes(self, prototypes):
+        """Matches best-first queries against per-student prototypes, falling back to raw rows near the threshold."""
+        self.prototypes = PrototypeSearch(self, prototypes) if prototypes is not None else None
+
+    def build_index(self, kind="auto"):
+        """Builds the search backend ('exact', 'ivf' or 'auto') over the current gallery."""
+        index = make_index(kind, self)
+        if self.count:
+            index.build()
+        self.index = index
+        print(f"Face index: {index.kind} over {self.count} faces")
+
+    def load(self, encodings, names, ids):
+        """
+        Replaces the whole gallery. A contiguous float32 array (such as the
+        read-only np.memmap from gallery_store) is used in place without copying;
+        it is only copied if faces are added to it later.
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if not encodings.flags.c_contiguous:
+            encodings = np.ascontiguousarray(encodings)
+        self._vectors = encodings
+        self._sq_norms = np.einsum('ij,ij->i', encodings, encodings)
+        self.count = len(encodings)
+        self.names = list(names)
+        self.ids = list(ids)
+        self.index = None
+        self.prototypes = None
+
+    def add(self, encodings, names, ids):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if not len(encodings):
+            return
+        needed = self.count + len(encodings)
+
+        if needed > len(self._vectors):
+            # Grow geometrically so repeated enrollment stays amortized O(1)
+            capacity = max(needed, 2 * len(self._vectors))
+            vectors = np.empty((capacity, self.dim), dtype=np.float32)
+            sq_norms = np.empty(capacity, dtype=np.float32)
+            vectors[:self.count] = self._vectors[:self.count]
+            sq_norms[:self.count] = self._sq_norms[:self.count]
+            self._vectors, self._sq_norms = vectors, sq_norms
+
+        self._vectors[self.count:needed] = encodings
+        self._sq_norms[self.count:needed] = np.einsum('ij,ij->i', encodings, encodings)
+        self.names.extend(names)
+        self.ids.extend(ids)
+        self.count = needed
+        # An index built on the old gallery would miss the new rows; search exactly until rebuilt
+        self.index = None
+        self.prototypes = None
+
+    def distances(self, queries):
+        """Euclidean distance matrix of shape (N queries, M known faces)."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        sq = np.einsum('ij,ij->i', queries, queries)
+        dist = queries @ self.vectors.T
+        dist *= -2.0
+        dist += sq[:, None]
+        dist += self._sq_norms[None, :self.count]
+        np.maximum(dist, 0.0, out=dist)  # Rounding can push exact matches slightly below zero
+        return np.sqrt(dist, out=dist)
+
+    def search(self, queries, k=1):
+        """
+        Top-k nearest known faces for each query, using the index if one is built.
+        Returns (indices, distances), both of shape (N, k) and sorted best-first.
+        Approximate indexes may return fewer than k hits, padded with index -1.
+        """
+        if self.index is not None:
+            return self.index.search(queries, min(k, self.count))
+        return self.exact_search(queries, k)
+
+    def exact_search(self, queries, k=1):
+        dist = self.distances(queries)
+        k = min(k, self.count)
+        if k < self.count:
+            idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(self.count), dist.shape)
+        top = np.take_along_axis(dist, idx, axis=1)
+        order = np.argsort(top, axis=1)
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def match(self, queries, threshold, k=1):
+        """
+        For each query, returns a list of up to k (name, student_id, distance) tuples, best-first.
+        Entries farther than `threshold` are reported as ("Unknown", None, distance).
+        """
+        n = len(np.asarray(queries).reshape(-1, self.dim))
+        if self.count == 0:
+            return [[("Unknown", None, float("inf"))] for _ in range(n)]
+
+        if self.prototypes is not None and k == 1:
+            return [[match] for match in self.prototypes.identify(queries, threshold)]
+
+        indices, distances = self.search(queries, k)
+        results = []
+        for row_idx, row_dist in zip(indices, distances):
+            row = []
+            for i, d in zip(row_idx, row_dist):
+                if i < 0:
+                    row.append(("Unknown", None, float("inf")))
+                elif d < threshold:
+                    row.append((self.names[i], self.ids[i], float(d)))
+                else:
+                    row.append(("Unknown", None, float(d)))
+            results.append(row)
+        return results
+
+    def identify(self, queries, threshold):
+        """Best match per query: list of (name, student_id, distance)."""
+        return [row[0] for row in self.match(queries, threshold, k=1)]
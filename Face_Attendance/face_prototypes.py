@@ -0,0 +1,137 @@
+import numpy as np
+
+# Compiled gallery settings
+PROTOTYPE_METHOD = "medoids" # "mean" (one centroid per student) or "medoids" (k-medoids)
+PROTOTYPES_PER_STUDENT = 3
+PROTOTYPE_MARGIN = 0.05 # Prototype distance this far inside the threshold is accepted without the raw vectors
+
+
+def _pairwise(x):
+    diff = x[:, None, :] - x[None, :, :]
+    return np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+
+
+def _k_medoids(x, k, iterations=10):
+    """Small k-medoids (alternating assign/update) for one student's images. Returns (medoid rows, labels)."""
+    dist = _pairwise(x)
+    # Farthest-point initialisation starting from the most central image
+    medoids = [int(np.argmin(dist.sum(axis=1)))]
+    while len(medoids) < k:
+        medoids.append(int(np.argmax(dist[:, medoids].min(axis=1))))
+    medoids = np.array(medoids)
+
+    for _ in range(iterations):
+        labels = np.argmin(dist[:, medoids], axis=1)
+        new = medoids.copy()
+        for c in range(k):
+            members = np.flatnonzero(labels == c)
+            if len(members):
+                new[c] = members[np.argmin(dist[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(new, medoids):
+            break
+        medoids = new
+    return medoids, np.argmin(dist[:, medoids], axis=1)
+
+
+def compile_prototypes(encodings, names, ids, method=PROTOTYPE_METHOD, per_student=PROTOTYPES_PER_STUDENT):
+    """
+    Summarises the raw gallery into a few prototypes per student.
+    Every prototype keeps its spread radius (distance to its farthest member)
+    and the raw rows it covers, so matching can fall back to them near the threshold.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    vectors, proto_names, proto_ids, radius, members = [], [], [], [], []
+
+    rows_by_student = {}
+    for row, student_id in enumerate(ids):
+        rows_by_student.setdefault(student_id, []).append(row)
+
+    for student_id, rows in rows_by_student.items():
+        rows = np.array(rows)
+        x = encodings[rows]
+        if method == "mean":
+            centres, labels = [x.mean(axis=0)], np.zeros(len(rows), dtype=int)
+        elif method == "medoids":
+            medoids, labels = _k_medoids(x, min(per_student, len(rows)))
+            centres = x[medoids]
+        else:
+            raise ValueError(f"Unknown prototype method: {method}")
+
+        for c, centre in enumerate(centres):
+            cluster = rows[labels == c]
+            vectors.append(centre)
+            proto_names.append(names[rows[0]])
+            proto_ids.append(student_id)
+            radius.append(float(np.linalg.norm(encodings[cluster] - centre, axis=1).max()))
+            members.append(cluster.tolist())
+
+    dim = encodings.shape[-1] if len(encodings) else 0
+    return {
+        "method": method,
+        "vectors": np.asarray(vectors, dtype=np.float32).reshape(-1, dim),
+        "names": proto_names,
+        "ids": proto_ids,
+        "radius": np.asarray(radius, dtype=np.float32),
+        "members": members,
+    }
+
+
+class PrototypeSearch:
+    """
+    Two-stage matching against a compiled gallery:
+      1. every query is compared with the prototypes only;
+      2. a best prototype well inside the threshold is accepted directly,
+         prototypes whose ball (distance - radius) cannot reach the threshold are ruled out,
+         and only the raw vectors of the remaining prototypes are checked exactly.
+    """
+
+    def __init__(self, matcher, prototypes, margin=PROTOTYPE_MARGIN):
+        self.matcher = matcher
+        self.margin = margin
+        self.vectors = np.ascontiguousarray(prototypes["vectors"], dtype=np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self.names = prototypes["names"]
+        self.ids = prototypes["ids"]
+        self.radius = np.asarray(prototypes["radius"], dtype=np.float32)
+        self.members = [np.asarray(m, dtype=np.int64) for m in prototypes["members"]]
+        self.accepted = 0
+        self.rejected = 0
+        self.fallbacks = 0
+
+    def identify(self, queries, threshold):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.matcher.dim)
+        dist = queries @ self.vectors.T
+        dist *= -2.0
+        dist += np.einsum('ij,ij->i', queries, queries)[:, None]
+        dist += self.sq_norms[None, :]
+        np.maximum(dist, 0.0, out=dist)
+        np.sqrt(dist, out=dist)
+
+        results = []
+        for qi, row in enumerate(dist):
+            best = int(np.argmin(row))
+            if row[best] < threshold - self.margin:
+                self.accepted += 1
+                results.append((self.names[best], self.ids[best], float(row[best])))
+                continue
+
+            candidates = np.flatnonzero(row - self.radius < threshold)
+            if not len(candidates):
+                self.rejected += 1
+                results.append(("Unknown", None, float(row[best])))
+                continue
+
+            # Near the threshold: exact distances to the raw images of the candidate prototypes
+            self.fallbacks += 1
+            rows = np.concatenate([self.members[c] for c in candidates])
+            raw = np.linalg.norm(self.matcher.vectors[rows] - queries[qi], axis=1)
+            i = int(np.argmin(raw))
+            d = float(raw[i])
+            if d < threshold:
+                results.append((self.matcher.names[rows[i]], self.matcher.ids[rows[i]], d))
+            else:
+                results.append(("Unknown", None, d))
+        return results
+
+    def stats(self):
+        return {"accepted": self.accepted, "rejected": self.rejected, "fallbacks": self.fallbacks}
@@ -1,47 +1,60 @@
 import cv2
 import face_recognition
-import pickle
 import numpy as np
 
 import os
+from face_matcher import FaceMatcher
+from face_prototypes import compile_prototypes
+from gallery_store import load_gallery
 
 # Resolve paths relative to this script
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ENCODINGS_FILE = os.path.join(BASE_DIR, "encodings.pkl")
+ENCODINGS_FILE = os.path.join(BASE_DIR, "encodings.gallery")
+LEGACY_PICKLE_FILE = os.path.join(BASE_DIR, "encodings.pkl") # Migrated to ENCODINGS_FILE on first load
 THRESHOLD = 0.45
+EMBEDDING_DIM = 128 # dlib face descriptor size
+INDEX_BACKEND = "auto" # "exact", "ivf" or "auto" (IVF only for campus-scale galleries)
+USE_PROTOTYPES = False # Match against the compiled per-student prototypes first
 
 class FaceRecognizer:
     def __init__(self):
-        self.known_encodings = []
-        self.known_names = []
-        self.known_ids = []
+        self.matcher = FaceMatcher(EMBEDDING_DIM)
         self.load_encodings()
 
+    @property
+    def known_names(self):
+        return self.matcher.names
+
+    @property
+    def known_ids(self):
+        return self.matcher.ids
+
     def load_encodings(self):
-        try:
-            with open(ENCODINGS_FILE, "rb") as f:
-                data = pickle.load(f)
-                self.known_encodings = data["encodings"]
-                self.known_names = data["names"]
-                self.known_ids = data["ids"]
-            print("Encodings loaded successfully.")
-        except FileNotFoundError:
-            print("Error: encodings.pkl not found. Run face_encoder.py first.")
+        data = load_gallery(ENCODINGS_FILE, LEGACY_PICKLE_FILE, model="dlib")
+        if data is None:
+            print("Error: encodings.gallery not found. Run face_encoder.py first.")
+            return
+        matcher = FaceMatcher(EMBEDDING_DIM)
+        matcher.load(data["encodings"], data["names"], data["ids"])
+        matcher.build_index(INDEX_BACKEND)
+        if USE_PROTOTYPES:
+            prototypes = data["prototypes"] or compile_prototypes(data["encodings"], data["names"], data["ids"])
+            matcher.set_prototypes(prototypes)
+        # Swap the whole gallery in one assignment: the recognition thread keeps
+        # matching against the old one until this line, never a half-loaded one
+        self.matcher = matcher
+        print("Encodings loaded successfully.")
+
+    def recognize_faces(self, frame_encodings, k=1):
+        """
+        Matches all encodings of a frame in one batch.
+        Returns a list of (name, student_id, distance), or lists of top-k tuples if k > 1.
+        """
+        results = self.matcher.match(frame_encodings, THRESHOLD, k=k)
+        if k == 1:
+            return [row[0] for row in results]
+        return results
 
     def recognize_face(self, frame_encoding):
-        if not self.known_encodings:
-             return "Unknown", None
-
-        matches = face_recognition.compare_faces(self.known_encodings, frame_encoding, tolerance=THRESHOLD)
-        name = "Unknown"
-        student_id = None
-        
-        face_distances = face_recognition.face_distance(self.known_encodings, frame_encoding)
-        
-        if len(face_distances) > 0:
-            best_match_index = np.argmin(face_distances)
-            if matches[best_match_index]:
-                name = self.known_names[best_match_index]
-                student_id = self.known_ids[best_match_index]
-                
+        name, student_id, _ = self.recognize_faces([frame_encoding])[0]
         return name, student_id
@@ -1,70 +1,115 @@
 import torch
 from facenet_pytorch import InceptionResnetV1
-import pickle
 import numpy as np
 import os
 from PIL import Image
+from face_matcher import FaceMatcher
+from face_prototypes import compile_prototypes
+from gallery_store import load_gallery
 
 # Settings
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ENCODINGS_FILE = os.path.join(BASE_DIR, "encodings_pt.pkl")
+ENCODINGS_FILE = os.path.join(BASE_DIR, "encodings_pt.gallery")
+LEGACY_PICKLE_FILE = os.path.join(BASE_DIR, "encodings_pt.pkl") # Migrated to ENCODINGS_FILE on first load
 THRESHOLD = 0.6 # Distance threshold for FaceNet (lower is stricter)
+EMBEDDING_DIM = 512 # InceptionResnetV1 embedding size
+INDEX_BACKEND = "auto" # "exact", "ivf" or "auto" (IVF only for campus-scale galleries)
+USE_PROTOTYPES = False # Match against the compiled per-student prototypes first
+FACE_SIZE = 160 # InceptionResnetV1 input size
 
 class FaceRecognizerPT:
     def __init__(self):
         self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
         self.resnet = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
-        self.known_encodings = []
-        self.known_names = []
-        self.known_ids = []
+        self.matcher = FaceMatcher(EMBEDDING_DIM)
         self.load_encodings()
 
+    @property
+    def known_names(self):
+        return self.matcher.names
+
+    @property
+    def known_ids(self):
+        return self.matcher.ids
+
     def load_encodings(self):
-        try:
-            with open(ENCODINGS_FILE, "rb") as f:
-                data = pickle.load(f)
-                self.known_encodings = data["encodings"]
-                self.known_names = data["names"]
-                self.known_ids = data["ids"]
-            print(f"PyTorch Encodings loaded successfully. ({len(self.known_encodings)} faces)")
-        except FileNotFoundError:
-            print("Error: encodings_pt.pkl not found. Run train_pt.py first.")
+        data = load_gallery(ENCODINGS_FILE, LEGACY_PICKLE_FILE, model="facenet")
+        if data is None:
+            print("Error: encodings_pt.gallery not found. Run train_pt.py first.")
+            return
+        matcher = FaceMatcher(EMBEDDING_DIM)
+        matcher.load(data["encodings"], data["names"], data["ids"])
+        matcher.build_index(INDEX_BACKEND)
+        if USE_PROTOTYPES:
+            prototypes = data["prototypes"] or compile_prototypes(data["encodings"], data["names"], data["ids"])
+            matcher.set_prototypes(prototypes)
+        # Swap the whole gallery in one assignment: the recognition thread keeps
+        # matching against the old one until this line, never a half-loaded one
+        self.matcher = matcher
+        print(f"PyTorch Encodings loaded successfully. ({len(self.matcher)} faces)")
 
-    def recognize_face(self, face_image_np):
+    def recognize_embeddings(self, embeddings, k=1):
         """
-        face_image_np: Numpy array of the cropped face (RGB)
+        Matches a batch of FaceNet embeddings against the gallery in one matrix operation.
+        Returns a list of (name, student_id, distance), or lists of top-k tuples if k > 1.
         """
-        if not self.known_encodings:
-            return "Unknown", None
+        results = self.matcher.match(embeddings, THRESHOLD, k=k)
+        if k == 1:
+            return [row[0] for row in results]
+        return results
 
-        try:
-            # Preprocess image for FaceNet
-            img = Image.fromarray(face_image_np)
-            img = img.resize((160, 160))
-            
-            # Convert to tensor and normalize (FaceNet expects whitened image if not using mtcnn.extract)
-            # Standard normalization for InceptionResnetV1 in facenet-pytorch
-            img_tensor = torch.tensor(np.array(img)).float().permute(2, 0, 1) / 255.0
-            img_tensor = (img_tensor - 0.5) / 0.5 # Normalize to [-1, 1]
-            img_tensor = img_tensor.unsqueeze(0).to(self.device)
+    def embed_faces(self, frame_rgb, boxes):
+        """
+        Crops every (top, right, bottom, left) box out of an RGB frame and runs
+        FaceNet on all of them in a single forward pass.
+        Returns (embeddings, valid) where `valid` lists the box indices that were embedded.
+        Safe to call from several recognition workers at once (the batch is per call).
+        """
+        height, width = frame_rgb.shape[:2]
+        valid, crops = [], []
+        for i, (top, right, bottom, left) in enumerate(boxes):
+            top, left = max(top, 0), max(left, 0)
+            bottom, right = min(bottom, height), min(right, width)
+            if bottom > top and right > left:
+                valid.append(i)
+                crops.append(frame_rgb[top:bottom, left:right])
+        if not valid:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32), valid
 
-            # Get embedding
-            embedding = self.resnet(img_tensor).detach().cpu().numpy()[0]
+        batch = torch.empty((len(valid), 3, FACE_SIZE, FACE_SIZE), dtype=torch.float32)
+        for slot, crop in enumerate(crops):
+            # Same resize as the gallery: train_pt.py hands MTCNN PIL images, which it crops with PIL bilinear
+            face = np.array(Image.fromarray(crop).resize((FACE_SIZE, FACE_SIZE), Image.BILINEAR))
+            batch[slot].copy_(torch.from_numpy(face).permute(2, 0, 1))
 
-            # Compare with known encodings (Euclidean distance)
-            # Calculate distances to all known encodings
-            distances = np.linalg.norm(self.known_encodings - embedding, axis=1)
-            
-            min_dist_idx = np.argmin(distances)
-            min_dist = distances[min_dist_idx]
+        # Standard normalization for InceptionResnetV1 in facenet-pytorch: [0, 255] -> [-1, 1]
+        batch.sub_(127.5).div_(127.5)
 
-            if min_dist < THRESHOLD:
-                name = self.known_names[min_dist_idx]
-                student_id = self.known_ids[min_dist_idx]
-                return name, student_id, min_dist
-            else:
-                return "Unknown", None, min_dist
+        with torch.inference_mode():
+            embeddings = self.resnet(batch.to(self.device)).cpu().numpy()
+        return embeddings, valid
 
+    def recognize_faces(self, frame_rgb, boxes):
+        """
+        Batch API: recognizes every face box of a frame with one FaceNet forward pass
+        and one gallery match. Returns one (name, student_id, distance) per box.
+        """
+        results = [("Unknown", None, float("inf"))] * len(boxes)
+        if not len(self.matcher) or len(boxes) == 0:
+            return results
+
+        try:
+            embeddings, valid = self.embed_faces(frame_rgb, boxes)
+            for i, match in zip(valid, self.recognize_embeddings(embeddings)):
+                results[i] = match
+            return results
         except Exception as e:
             print(f"Error in PT recognition: {e}")
-            return "Error", None, 0.0
+            return [("Error", None, 0.0)] * len(boxes)
+
+    def recognize_face(self, face_image_np):
+        """
+        face_image_np: Numpy array of the cropped face (RGB)
+        """
+        height, width = face_image_np.shape[:2]
+        return self.recognize_faces(face_image_np, [(0, width, height, 0)])[0]
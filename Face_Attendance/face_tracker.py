@@ -0,0 +1,152 @@
+import time
+import cv2
+import numpy as np
+
+# Detect-then-track settings
+DETECT_EVERY = 5 # Full face detection every N processed frames; optical flow in between
+MIN_TRACK_POINTS = 6 # Fewer well-tracked points than this and the face counts as lost
+MIN_TRACK_CONFIDENCE = 0.5 # Share of a face's points that must survive a step
+MAX_FB_ERROR = 1.5 # Pixels; forward-backward flow error above this rejects a point
+MAX_CORNERS = 40 # Feature points seeded per face
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+class FaceTracker:
+    """
+    Replaces per-frame face detection with detect-then-track.
+
+    Every `detect_every` frames (or as soon as a tracked face loses too many
+    feature points) the real detector runs and each box is seeded with corner
+    features. On the frames in between the features are followed with
+    pyramidal Lucas-Kanade optical flow, and each box is shifted and scaled
+    by the median motion of its points. Boxes use face_recognition's
+    (top, right, bottom, left) order.
+    """
+
+    def __init__(self, detect_every=DETECT_EVERY):
+        self.detect_every = max(1, int(detect_every))
+        self._prev_gray = None
+        self._tracks = [] # [(box, points Nx1x2 float32)]
+        self._since_detect = 0
+        # Metrics
+        self.frames = 0
+        self.detections = 0
+        self.redetect_lost = 0
+        self.tracked_frames = 0
+        self._detect_time = 0.0
+        self._track_time = 0.0
+
+    def reset(self):
+        """Forget all tracks (e.g. when attendance stops); the next frame runs the detector."""
+        self._prev_gray = None
+        self._tracks = []
+
+    @property
+    def boxes(self):
+        """Boxes of the faces currently being tracked."""
+        return [box for box, _ in self._tracks]
+
+    def locate(self, rgb, detect=None):
+        """
+        Face boxes for this frame. `detect(rgb)` is the full detector and is only
+        called when a detection is due or a face was lost. Without `detect` the
+        existing tracks are followed and a lost face simply drops out.
+        """
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        self.frames += 1
+
+        boxes = None
+        due = detect is not None and self._since_detect >= self.detect_every - 1
+        if self._prev_gray is not None and not due:
+            start = time.perf_counter()
+            boxes = self._propagate(gray)
+            self._track_time += time.perf_counter() - start
+            if boxes is None:
+                self.redetect_lost += 1
+            else:
+                self.tracked_frames += 1
+                self._since_detect += 1
+
+        if boxes is None and detect is None:
+            boxes = []
+            self._tracks = []
+        elif boxes is None:
+            start = time.perf_counter()
+            boxes = [tuple(int(v) for v in box) for box in detect(rgb)]
+            self._detect_time += time.perf_counter() - start
+            self.detections += 1
+            self._since_detect = 0
+            self._tracks = [(box, self._seed(gray, box)) for box in boxes]
+
+        self._prev_gray = gray
+        return boxes
+
+    def _seed(self, gray, box):
+        top, right, bottom, left = box
+        mask = np.zeros_like(gray)
+        mask[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)] = 255
+        points = cv2.goodFeaturesToTrack(gray, MAX_CORNERS, 0.01, 3, mask=mask)
+        if points is None or len(points) < MIN_TRACK_POINTS:
+            # Flat patch: fall back to a grid over the inner part of the box
+            ys = np.linspace(top + (bottom - top) * 0.25, bottom - (bottom - top) * 0.25, 4)
+            xs = np.linspace(left + (right - left) * 0.25, right - (right - left) * 0.25, 4)
+            points = np.array([[[x, y]] for y in ys for x in xs], dtype=np.float32)
+        return points.astype(np.float32)
+
+    def _propagate(self, gray):
+        """Moves every tracked box to the new frame. Returns None if any face was lost."""
+        if not self._tracks:
+            return []
+        if self._prev_gray.shape != gray.shape:
+            return None
+        p0 = np.concatenate([points for _, points in self._tracks])
+        # All faces in one flow call, checked forwards and backwards
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, p0, None, **LK_PARAMS)
+        p0r, st_back, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, p1, None, **LK_PARAMS)
+        fb_error = np.abs(p0 - p0r).reshape(-1, 2).max(axis=1)
+        good = (st.ravel() == 1) & (st_back.ravel() == 1) & (fb_error < MAX_FB_ERROR)
+
+        height, width = gray.shape
+        tracks, boxes = [], []
+        offset = 0
+        for box, points in self._tracks:
+            n = len(points)
+            ok = good[offset:offset + n]
+            old = p0[offset:offset + n][ok].reshape(-1, 2)
+            new = p1[offset:offset + n][ok].reshape(-1, 2)
+            offset += n
+            if len(new) < MIN_TRACK_POINTS or len(new) < MIN_TRACK_CONFIDENCE * n:
+                return None
+
+            # Median shift, and median change of spread for scale (robust to a few bad points)
+            dx, dy = np.median(new - old, axis=0)
+            old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+            new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+            valid = old_spread > 1e-3
+            scale = float(np.median(new_spread[valid] / old_spread[valid])) if valid.any() else 1.0
+
+            top, right, bottom, left = box
+            cx, cy = (left + right) / 2 + dx, (top + bottom) / 2 + dy
+            half_w, half_h = (right - left) * scale / 2, (bottom - top) * scale / 2
+            new_box = (int(round(max(cy - half_h, 0))), int(round(min(cx + half_w, width))),
+                       int(round(min(cy + half_h, height))), int(round(max(cx - half_w, 0))))
+            if new_box[2] - new_box[0] < 4 or new_box[1] - new_box[3] < 4:
+                return None # Drifted off the frame
+            tracks.append((new_box, new.reshape(-1, 1, 2)))
+            boxes.append(new_box)
+
+        self._tracks = tracks
+        return boxes
+
+    def stats(self):
+        return {
+            "detect_every": self.detect_every,
+            "frames": self.frames,
+            "detections": self.detections,
+            "tracked_frames": self.tracked_frames,
+            "redetect_lost": self.redetect_lost,
+            "detection_ratio": round(self.detections / self.frames, 3) if self.frames else None,
+            "avg_detect_ms": round(self._detect_time / self.detections * 1000, 2) if self.detections else None,
+            "avg_track_ms": round(self._track_time / self.tracked_frames * 1000, 2) if self.tracked_frames else None,
+        }
@@ -11,6 +11,7 @@ def drop_attendance_table():
         cursor = conn.cursor()
         try:
             cursor.execute("DROP TABLE IF EXISTS attendance")
+            cursor.execute("PRAGMA user_version = 0") # Let init_db() recreate it with the current schema
             conn.commit()
             print("Dropped 'attendance' table to remove constraints.")
         except Exception as e:
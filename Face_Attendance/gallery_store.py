@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import pickle
+import struct
+import numpy as np
+
+# On-disk gallery format (little endian):
+#   magic (8 bytes) | version (uint32) | header length (uint32) | header (JSON)
+#   padding up to a 64-byte boundary
+#   data section: float32 arrays (embeddings first), each 64-byte aligned
+#   id/name table (JSON)
+# Offsets in the header are relative to the start of the data section.
+MAGIC = b"FAGALLRY"
+VERSION = 1
+ALIGN = 64
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PICKLE_MIGRATIONS = [
+    (os.path.join(BASE_DIR, "encodings.pkl"), os.path.join(BASE_DIR, "encodings.gallery"), "dlib"),
+    (os.path.join(BASE_DIR, "encodings_pt.pkl"), os.path.join(BASE_DIR, "encodings_pt.gallery"), "facenet"),
+]
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_gallery(path, encodings, names, ids, prototypes=None, model=None, paths=None):
+    """
+    Writes a gallery file atomically: the data goes to a temporary file in the
+    same folder which is fsynced and then swapped in with os.replace, so readers
+    see either the old or the new gallery, never a half-written one.
+    """
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+    if encodings.ndim != 2:
+        encodings = encodings.reshape(len(names), -1) if len(names) else encodings.reshape(0, 0)
+    arrays = {"embeddings": encodings}
+    table = {"names": [str(n) for n in names], "ids": [str(i) for i in ids]}
+    if paths is not None:
+        # Source image of every row (relative to dataset/), used by incremental training
+        table["paths"] = list(paths)
+    if prototypes is not None:
+        arrays["proto_vectors"] = np.ascontiguousarray(prototypes["vectors"], dtype=np.float32)
+        arrays["proto_radius"] = np.ascontiguousarray(prototypes["radius"], dtype=np.float32)
+        table["prototypes"] = {
+            "method": prototypes["method"],
+            "names": list(prototypes["names"]),
+            "ids": list(prototypes["ids"]),
+            "members": [list(map(int, m)) for m in prototypes["members"]],
+        }
+
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {"offset": offset, "shape": list(array.shape)}
+        offset = _aligned(offset + array.nbytes)
+    table_bytes = json.dumps(table).encode("utf-8")
+
+    header = json.dumps({
+        "dtype": "float32",
+        "model": model,
+        "count": int(encodings.shape[0]),
+        "dim": int(encodings.shape[1]) if encodings.size else 0,
+        "arrays": layout,
+        "table": {"offset": offset, "length": len(table_bytes)},
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<II", VERSION, len(header)) + header
+    data_start = _aligned(len(prefix))
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix)
+        f.write(b"\0" * (data_start - len(prefix)))
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.seek(data_start + offset)
+        f.write(table_bytes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_gallery(path, copy=False):
+    """
+    Opens a gallery file. Embeddings are returned as a read-only np.memmap, so
+    startup does not read the vectors and all processes share the same pages.
+    Use copy=True to load them into memory instead (needed on Windows, where a
+    mapped file cannot be replaced by the next training run).
+    Returns the same dict layout as the old pickles: encodings, names, ids (+ prototypes, paths).
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gallery file")
+        version, header_len = struct.unpack("<II", f.read(8))
+        if version > VERSION:
+            raise ValueError(f"{path}: unsupported gallery version {version}")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+        data_start = _aligned(len(MAGIC) + 8 + header_len)
+        f.seek(data_start + header["table"]["offset"])
+        table = json.loads(f.read(header["table"]["length"]).decode("utf-8"))
+
+    arrays = {}
+    for name, info in header["arrays"].items():
+        shape = tuple(info["shape"])
+        if not np.prod(shape):
+            arrays[name] = np.empty(shape, dtype=np.float32)
+            continue
+        arrays[name] = np.memmap(path, dtype=np.float32, mode="r", offset=data_start + info["offset"], shape=shape)
+        if copy:
+            arrays[name] = np.array(arrays[name])
+
+    data = {
+        "encodings": arrays["embeddings"],
+        "names": table["names"],
+        "ids": table["ids"],
+        "model": header.get("model"),
+        "paths": table.get("paths"),
+        "prototypes": None,
+    }
+    if "prototypes" in table:
+        data["prototypes"] = dict(table["prototypes"],
+                                  vectors=arrays["proto_vectors"],
+                                  radius=arrays["proto_radius"])
+    return data
+
+
+def migrate_pickle(pickle_path, gallery_path, model=None):
+    """One-shot conversion of an old encodings pickle into the gallery format."""
+    with open(pickle_path, "rb") as f:
+        data = pickle.load(f)
+    encodings = np.asarray(data["encodings"], dtype=np.float32)
+    write_gallery(gallery_path, encodings, data["names"], data["ids"], data.get("prototypes"), model)
+    print(f"Migrated {pickle_path} -> {gallery_path} ({len(encodings)} faces)")
+
+
+def load_gallery(gallery_path, pickle_path=None, model=None):
+    """Opens a gallery, migrating the legacy pickle first if only that exists. Returns None if neither exists."""
+    if not os.path.exists(gallery_path):
+        if pickle_path and os.path.exists(pickle_path):
+            migrate_pickle(pickle_path, gallery_path, model)
+        else:
+            return None
+    return read_gallery(gallery_path, copy=(os.name == "nt"))
+
+
+def file_fingerprint(path, previous=None):
+    """
+    (mtime, size, sha1) of an image file. The content hash is only recomputed
+    when mtime or size differ from the `previous` fingerprint.
+    """
+    st = os.stat(path)
+    if previous and previous.get("mtime") == st.st_mtime and previous.get("size") == st.st_size:
+        return previous
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return {"mtime": st.st_mtime, "size": st.st_size, "sha1": digest}
+
+
+def read_manifest(path, model_tag):
+    """Per-image manifest written next to a gallery. Empty if missing or built with a different model."""
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get("model") != model_tag:
+        return {}
+    return manifest.get("files", {})
+
+
+def write_manifest(path, model_tag, files):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump({"model": model_tag, "files": files}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    for pickle_path, gallery_path, model in PICKLE_MIGRATIONS:
+        if os.path.exists(pickle_path):
+            migrate_pickle(pickle_path, gallery_path, model)
+        else:
+            print(f"Skipping {pickle_path}: not found.")
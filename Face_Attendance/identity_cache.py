@@ -0,0 +1,150 @@
+from collections import Counter
+
+# Track-level identity voting
+IOU_MATCH = 0.3 # A box continues a track if it overlaps the track's last box at least this much
+TRACK_MAX_MISSES = 3 # Processed frames a track survives without a matching box (skipped frames don't count)
+COMMIT_VOTES = 2 # Agreeing verifications needed before an identity (and attendance) is committed
+COMMIT_SHARE = 0.75 # ...and the share of the track's votes that identity must hold
+UNKNOWN_VOTES = 5 # Verifications with no agreement before a track is settled as Unknown
+UNKNOWN_RECHECK = 3.0 # Seconds before a settled-Unknown track is verified again (pose/lighting may improve)
+COMMITTED_RECHECK = 2.0 # Seconds between re-verifications of a committed track (someone else may have stepped in)
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    inter_h = min(a[2], b[2]) - max(a[0], b[0])
+    inter_w = min(a[1], b[1]) - max(a[3], b[3])
+    if inter_h <= 0 or inter_w <= 0:
+        return 0.0
+    inter = inter_h * inter_w
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+class FaceTrack:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.misses = 0
+        self.votes = Counter() # (student_id, name) -> agreeing verifications; None -> no agreement
+        self.identity = None # (student_id, name) once committed
+        self.settled_unknown_at = None
+        self.checked_at = None # Time of the last verification
+
+    @property
+    def committed(self):
+        return self.identity is not None
+
+
+class IdentityCache:
+    """
+    Remembers who each face on screen is, so the embedding models only run
+    on faces that are new or not yet identified.
+
+    Boxes are matched to tracks by IoU with the track's last box. Every
+    double-verification result for a track is a vote; once one student holds
+    COMMIT_VOTES votes (and COMMIT_SHARE of them) the identity is committed and
+    reused, with one re-verification every COMMITTED_RECHECK seconds in case
+    a different person took over the track's box; a re-verification that
+    disagrees drops the identity and the track starts voting again. A track
+    that keeps failing verification is settled as Unknown and rechecked every
+    UNKNOWN_RECHECK seconds.
+    """
+
+    def __init__(self):
+        self._tracks = []
+        self._next_id = 1
+        # Metrics
+        self.tracks_created = 0
+        self.verifications = 0
+        self.cache_hits = 0
+        self.commits = 0
+        self.revoked = 0
+
+    def reset(self):
+        self._tracks = []
+
+    def assign(self, boxes):
+        """Returns the FaceTrack for each box (new tracks for unmatched boxes); drops tracks gone for too long."""
+        pairs = sorted(((iou(box, t.box), i, t) for i, box in enumerate(boxes) for t in self._tracks),
+                       key=lambda p: p[0], reverse=True)
+        assigned, used = {}, set()
+        for overlap, i, track in pairs:
+            if overlap < IOU_MATCH:
+                break
+            if i in assigned or track.id in used:
+                continue
+            assigned[i] = track
+            used.add(track.id)
+
+        for track in self._tracks:
+            track.misses = 0 if track.id in used else track.misses + 1
+        self._tracks = [t for t in self._tracks if t.misses <= TRACK_MAX_MISSES]
+
+        result = []
+        for i, box in enumerate(boxes):
+            track = assigned.get(i)
+            if track is None:
+                track = FaceTrack(self._next_id, box)
+                self._next_id += 1
+                self._tracks.append(track)
+                self.tracks_created += 1
+            track.box = box
+            result.append(track)
+        return result
+
+    def needs_check(self, track, now):
+        """True if the models should run on this track's face in the current frame."""
+        if track.committed:
+            if now - track.checked_at < COMMITTED_RECHECK:
+                self.cache_hits += 1
+                return False
+            return True
+        if track.settled_unknown_at is not None:
+            if now - track.settled_unknown_at < UNKNOWN_RECHECK:
+                self.cache_hits += 1
+                return False
+            # Recheck from scratch, so the old failures do not outvote a clear view
+            track.votes.clear()
+            track.settled_unknown_at = None
+        return True
+
+    def vote(self, track, identity, now):
+        """
+        Adds one verification result ((student_id, name), or None when the models
+        did not agree). Returns True if this vote committed the track's identity.
+        """
+        self.verifications += 1
+        track.checked_at = now
+        if track.committed:
+            if identity == track.identity:
+                return False
+            # Not the committed person any more: start over with this vote
+            track.identity = None
+            track.votes.clear()
+            self.revoked += 1
+        track.votes[identity] += 1
+        known = [(count, key) for key, count in track.votes.items() if key is not None]
+        if known:
+            count, best = max(known)
+            if count >= COMMIT_VOTES and count >= COMMIT_SHARE * sum(track.votes.values()):
+                track.identity = best
+                track.settled_unknown_at = None
+                self.commits += 1
+                return True
+        if track.votes[None] >= UNKNOWN_VOTES:
+            track.settled_unknown_at = now
+        return False
+
+    def stats(self):
+        checked = self.verifications + self.cache_hits
+        return {
+            "tracks": len(self._tracks),
+            "tracks_created": self.tracks_created,
+            "verifications": self.verifications,
+            "cache_hits": self.cache_hits,
+            "hit_ratio": round(self.cache_hits / checked, 3) if checked else None,
+            "commits": self.commits,
+            "revoked": self.revoked,
+        }
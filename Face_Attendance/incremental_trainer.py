@@ -0,0 +1,142 @@
+import os
+import time
+import numpy as np
+import face_encoder
+import train_pt
+from face_prototypes import compile_prototypes
+from gallery_store import read_gallery, write_gallery, read_manifest, write_manifest, file_fingerprint
+from parallel_encoder import DEFAULT_WORKERS, ProgressReporter
+
+DATASET_DIR = face_encoder.DATASET_DIR
+IMAGE_EXTENSIONS = train_pt.IMAGE_EXTENSIONS
+
+# Everything the trainer needs to know about each embedding model
+MODELS = {
+    "dlib": {
+        "gallery": face_encoder.ENCODINGS_FILE,
+        "manifest": face_encoder.MANIFEST_FILE,
+        "tag": face_encoder.MODEL_TAG,
+        "encode": face_encoder.encode_images,
+    },
+    "facenet": {
+        "gallery": train_pt.ENCODINGS_FILE,
+        "manifest": train_pt.MANIFEST_FILE,
+        "tag": train_pt.MODEL_TAG,
+        "encode": train_pt.encode_images_pt,
+    },
+}
+
+
+def scan_dataset(dataset_dir=DATASET_DIR):
+    """All enrollment images as (relative path, student_id, student_name), in a stable order."""
+    images = []
+    if not os.path.exists(dataset_dir):
+        return images
+    for student_folder in sorted(os.listdir(dataset_dir)):
+        folder_path = os.path.join(dataset_dir, student_folder)
+        if not os.path.isdir(folder_path):
+            continue
+        try:
+            student_id, student_name = student_folder.split('_', 1)
+        except ValueError:
+            print(f"Skipping folder {student_folder}: Invalid format. Use ID_Name.")
+            continue
+        for filename in sorted(os.listdir(folder_path)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((f"{student_folder}/{filename}", student_id, student_name))
+    return images
+
+
+def _existing_vectors(gallery_path):
+    """{relative path: vector} from the current gallery (empty for galleries written without paths)."""
+    if not os.path.exists(gallery_path):
+        return {}
+    data = read_gallery(gallery_path, copy=True)
+    if not data["paths"]:
+        return {}
+    return dict(zip(data["paths"], data["encodings"]))
+
+
+def update_gallery(model, progress=None, workers=DEFAULT_WORKERS):
+    """
+    Brings one model's gallery in line with dataset/:
+    only new or changed images (by mtime/size, then content hash) are encoded,
+    vectors of deleted images are dropped, everything else is reused.
+    Pending images are encoded in parallel (see parallel_encoder.py);
+    `progress(model, done, total)` is called after each encoded image.
+    Returns a summary dict.
+    """
+    cfg = MODELS[model]
+    start = time.time()
+    manifest = read_manifest(cfg["manifest"], cfg["tag"])
+    vectors = _existing_vectors(cfg["gallery"])
+
+    images = scan_dataset()
+    new_manifest = {}
+    pending = []
+    for rel_path, student_id, student_name in images:
+        image_path = os.path.join(DATASET_DIR, rel_path)
+        previous = manifest.get(rel_path)
+        fingerprint = file_fingerprint(image_path, previous)
+        unchanged = (previous is not None and previous["sha1"] == fingerprint["sha1"]
+                     and (not previous["face"] or rel_path in vectors))
+        if unchanged:
+            new_manifest[rel_path] = dict(previous, mtime=fingerprint["mtime"], size=fingerprint["size"])
+        else:
+            pending.append((rel_path, image_path, fingerprint))
+
+    callback = (lambda done, total: progress(model, done, total)) if progress else None
+    reporter = ProgressReporter(model, len(pending), callback)
+    results = cfg["encode"]([(rel_path, image_path) for rel_path, image_path, _ in pending], workers, reporter=reporter)
+
+    failed = []
+    for rel_path, image_path, fingerprint in pending:
+        if rel_path not in results:
+            # Raised an error (e.g. a read or decode failure): kept out of the manifest so the next run retries it
+            failed.append(rel_path)
+            vectors.pop(rel_path, None)
+            continue
+        encoding = results[rel_path]
+        if encoding is not None:
+            vectors[rel_path] = encoding
+        else:
+            vectors.pop(rel_path, None)
+        new_manifest[rel_path] = dict(fingerprint, face=encoding is not None)
+
+    known_encodings, known_names, known_ids, known_paths = [], [], [], []
+    for rel_path, student_id, student_name in images:
+        if rel_path in new_manifest and new_manifest[rel_path]["face"] and rel_path in vectors:
+            known_encodings.append(vectors[rel_path])
+            known_names.append(student_name)
+            known_ids.append(student_id)
+            known_paths.append(rel_path)
+
+    removed = len(set(manifest) - set(new_manifest) - set(failed))
+    if pending or removed or not os.path.exists(cfg["gallery"]):
+        known_encodings = np.asarray(known_encodings, dtype=np.float32)
+        prototypes = compile_prototypes(known_encodings, known_names, known_ids)
+        write_gallery(cfg["gallery"], known_encodings, known_names, known_ids, prototypes, model=model, paths=known_paths)
+    write_manifest(cfg["manifest"], cfg["tag"], new_manifest)
+
+    summary = {
+        "model": model,
+        "images": len(images),
+        "encoded": len(pending) - len(failed),
+        "failed": len(failed),
+        "reused": len(images) - len(pending),
+        "removed": removed,
+        "faces": len(known_paths),
+        "seconds": round(time.time() - start, 2),
+    }
+    print(f"[{model}] {summary['encoded']} encoded, {summary['reused']} reused, "
+          f"{summary['removed']} removed, {summary['failed']} failed -> {summary['faces']} faces in {summary['seconds']}s")
+    return summary
+
+
+def train_incremental(models=("dlib", "facenet"), progress=None, workers=DEFAULT_WORKERS):
+    """Updates every model's gallery. Callers reload their recognizers afterwards."""
+    return [update_gallery(model, progress, workers) for model in models]
+
+
+if __name__ == "__main__":
+    train_incremental()
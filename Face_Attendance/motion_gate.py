@@ -0,0 +1,126 @@
+import time
+import cv2
+import numpy as np
+
+# Motion gate settings
+GATE_WIDTH = 160 # Frames are compared at this width; motion is coarse, so tiny is enough
+DIFF_THRESHOLD = 25 # Grey-level change that counts as a changed pixel
+MIN_MOTION_AREA = 0.003 # Share of the frame that must change before recognition runs
+BACKGROUND_ALPHA = 0.1 # Running-average background; slow lighting drift is absorbed
+MAX_IDLE_SECONDS = 5.0 # Run recognition at least this often even in a still room
+ROI_MARGIN = 0.25 # Changed regions are grown by this fraction before detecting in them
+ROI_MAX_AREA = 0.5 # If regions cover more than this share of the frame, detect on the whole frame
+
+
+def _merge(rects):
+    """Merges overlapping (x0, y0, x1, y1) rectangles until none overlap."""
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+class MotionGate:
+    """
+    Cheap change detector in front of recognition.
+
+    Each frame is shrunk to GATE_WIDTH, blurred and compared with a running
+    average of previous frames. update() says whether enough of the frame
+    changed to be worth recognising, and remembers where it changed so
+    restrict() can limit face detection to those regions.
+    """
+
+    def __init__(self):
+        self._background = None
+        self._regions = []
+        self._last_pass = 0.0
+        # Metrics
+        self.frames = 0
+        self.skipped = 0
+        self.roi_detections = 0
+        self.full_detections = 0
+
+    def reset(self):
+        self._background = None
+        self._regions = []
+
+    def update(self, rgb):
+        """Feeds one frame. Returns True if recognition should run on it."""
+        height, width = rgb.shape[:2]
+        scale = GATE_WIDTH / float(width)
+        small = cv2.resize(rgb, (GATE_WIDTH, max(int(height * scale), 1)), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_RGB2GRAY), (5, 5), 0).astype(np.float32)
+        self.frames += 1
+
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            self._regions = [(0, 0, width, height)]
+            self._last_pass = time.time()
+            return True
+
+        diff = cv2.absdiff(gray, self._background)
+        cv2.accumulateWeighted(gray, self._background, BACKGROUND_ALPHA)
+        mask = cv2.dilate((diff > DIFF_THRESHOLD).astype(np.uint8), None, iterations=2)
+        changed = cv2.countNonZero(mask) / float(mask.size)
+
+        now = time.time()
+        if changed < MIN_MOTION_AREA:
+            if now - self._last_pass < MAX_IDLE_SECONDS:
+                self.skipped += 1
+                return False
+            self._regions = [(0, 0, width, height)] # Periodic full check of a still scene
+        else:
+            count, _, boxes, _ = cv2.connectedComponentsWithStats(mask)
+            self._regions = [(x / scale, y / scale, (x + w) / scale, (y + h) / scale)
+                             for x, y, w, h, _ in boxes[1:count]]
+        self._last_pass = now
+        return True
+
+    def restrict(self, detect, keep=()):
+        """
+        Wraps `detect(rgb)` so it only looks at the regions that changed in the
+        last update(), plus the `keep` boxes ((top, right, bottom, left), e.g.
+        faces already being tracked). Falls back to the whole frame when the
+        regions cover most of it anyway.
+        """
+        def detect_regions(rgb):
+            height, width = rgb.shape[:2]
+            rects = list(self._regions) + [(left, top, right, bottom) for top, right, bottom, left in keep]
+            grown = []
+            for x0, y0, x1, y1 in rects:
+                grow_x, grow_y = (x1 - x0) * ROI_MARGIN, (y1 - y0) * ROI_MARGIN
+                grown.append((max(int(x0 - grow_x), 0), max(int(y0 - grow_y), 0),
+                              min(int(x1 + grow_x), width), min(int(y1 + grow_y), height)))
+            rects = _merge(grown)
+            if not rects or sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects) > ROI_MAX_AREA * width * height:
+                self.full_detections += 1
+                return detect(rgb)
+
+            self.roi_detections += 1
+            boxes = []
+            for x0, y0, x1, y1 in rects:
+                crop = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+                for top, right, bottom, left in detect(crop):
+                    boxes.append((top + y0, right + x0, bottom + y0, left + x0))
+            return boxes
+        return detect_regions
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "skip_ratio": round(self.skipped / self.frames, 3) if self.frames else None,
+            "roi_detections": self.roi_detections,
+            "full_detections": self.full_detections,
+        }
@@ -0,0 +1,266 @@
+import json
+import os
+import smtplib
+import threading
+import time
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from database import db
+
+# Dispatcher settings
+POLL_INTERVAL = 30.0 # Seconds between outbox checks when nothing wakes the dispatcher
+RETRY_BASE_DELAY = 5.0 # First retry after 5s, then 10s, 20s, ...
+RETRY_MAX_DELAY = 600.0
+MAX_ATTEMPTS = 8 # Then the notification is marked 'failed' (kept in the outbox for inspection)
+SEND_LEASE = 120.0 # Seconds a claimed row stays 'sending'; a dispatcher that dies mid-send frees it after this
+ERROR_BACKOFF_MAX = 60.0 # Longest pause after the dispatcher loop itself fails (e.g. database unavailable)
+SMTP_IDLE_TIMEOUT = 60.0 # Seconds an unused SMTP connection is kept open for the next message
+SMTP_TIMEOUT = 30.0
+
+
+def make_smtp_factory(host, port, user, password, use_tls=True):
+    """Returns a function that opens a ready-to-send SMTP connection (STARTTLS + login)."""
+    def connect():
+        server = smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT)
+        if use_tls:
+            server.starttls()
+        if user:
+            server.login(user, password)
+        return server
+    return connect
+
+
+def make_twilio_factory(sid, auth_token):
+    def connect():
+        from twilio.rest import Client
+        return Client(sid, auth_token)
+    return connect
+
+
+def build_email(sender, receiver, subject, body, attachment=None):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = receiver
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+
+    # Attachment
+    if attachment and os.path.exists(attachment):
+        with open(attachment, "rb") as f:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(f.read())
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', "attachment; filename= " + os.path.basename(attachment))
+        msg.attach(part)
+    return msg
+
+
+class SmtpSender:
+    """Keeps one SMTP connection open between messages instead of reconnecting for each."""
+
+    def __init__(self, factory, sender, receiver):
+        self.factory = factory
+        self.sender = sender
+        self.receiver = receiver
+        self._server = None
+        self._last_used = 0.0
+        self.connects = 0
+
+    def _connection(self):
+        if self._server is not None:
+            try:
+                self._server.noop()
+            except Exception:
+                self.close()
+        if self._server is None:
+            self._server = self.factory()
+            self.connects += 1
+        return self._server
+
+    def send(self, payload):
+        msg = build_email(self.sender, payload.get("to") or self.receiver, payload["subject"],
+                          payload["body"], payload.get("attachment"))
+        try:
+            self._connection().sendmail(self.sender, msg['To'], msg.as_string())
+        except Exception:
+            self.close() # Reconnect on the next attempt
+            raise
+        self._last_used = time.time()
+        return "sent"
+
+    def close_if_idle(self):
+        if self._server is not None and time.time() - self._last_used > SMTP_IDLE_TIMEOUT:
+            self.close()
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+
+class TwilioSender:
+    """One Twilio client (and its HTTP keep-alive session) for every WhatsApp message."""
+
+    def __init__(self, factory, sender, receiver):
+        self.factory = factory
+        self.sender = sender
+        self.receiver = receiver
+        self._client = None
+
+    def send(self, payload):
+        if self._client is None:
+            self._client = self.factory()
+        message = self._client.messages.create(from_=self.sender, body=payload["body"],
+                                               to=payload.get("to") or self.receiver)
+        return message.sid
+
+    def close_if_idle(self):
+        pass
+
+    def close(self):
+        self._client = None
+
+
+class NotificationDispatcher(threading.Thread):
+    """
+    Sends notifications from the outbox table on a background thread.
+
+    enqueue() only inserts a row, so the request that triggered it returns
+    at once. The dispatcher sends due rows oldest first; failures are retried
+    with exponential backoff up to MAX_ATTEMPTS. Rows survive restarts, so a
+    notification queued just before shutdown is sent on the next start.
+    Each row is claimed ('pending' -> 'sending', with a SEND_LEASE) before it
+    is sent, so two dispatchers (e.g. two app processes) never send the same
+    row; a claim whose dispatcher died is released when the lease runs out.
+    `senders` maps channel -> object with send(payload) / close_if_idle() / close(),
+    which is how tests plug in a local SMTP stub or a fake Twilio client.
+    """
+
+    def __init__(self, senders):
+        super().__init__(name="NotificationDispatcher", daemon=True)
+        self.senders = senders
+        self._cond = threading.Condition()
+        self._wake = False
+        self._stopping = False
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    def enqueue(self, channel, payload):
+        """Stores a notification and wakes the dispatcher. Returns the outbox row id."""
+        if channel not in self.senders:
+            raise ValueError(f"Unknown notification channel: {channel}")
+        now = time.time()
+        row_id = db.write(lambda conn: conn.execute(
+            "INSERT INTO outbox (channel, payload, next_attempt_ts, created_ts) VALUES (?, ?, ?, ?)",
+            (channel, json.dumps(payload), now, now)).lastrowid)
+        with self._cond:
+            self._wake = True
+            self._cond.notify_all()
+        return row_id
+
+    def run(self):
+        error_delay = 1.0
+        while True:
+            try:
+                wait = self._next_wait()
+            except Exception as e:
+                print(f"Notification dispatcher error: {e}")
+                wait = error_delay
+            with self._cond:
+                self._cond.wait_for(lambda: self._wake or self._stopping, wait)
+                self._wake = False
+                if self._stopping:
+                    break
+            try:
+                self.dispatch_due()
+                for sender in self.senders.values():
+                    sender.close_if_idle()
+                error_delay = 1.0
+            except Exception as e:
+                # Keep the thread alive; rows stay in the outbox and are picked up once things recover
+                print(f"Notification dispatcher error (retrying in {error_delay:.0f}s): {e}")
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stopping, error_delay)
+                error_delay = min(error_delay * 2, ERROR_BACKOFF_MAX)
+        for sender in self.senders.values():
+            sender.close()
+
+    def _next_wait(self):
+        row = db.read("""
+            SELECT MIN(CASE status WHEN 'pending' THEN next_attempt_ts ELSE lease_until END) FROM outbox
+            WHERE status IN ('pending', 'sending')
+        """)[0]
+        if row[0] is None:
+            return POLL_INTERVAL
+        return min(max(row[0] - time.time(), 0.0), POLL_INTERVAL)
+
+    def _claim(self, row_id):
+        """Marks a pending row as being sent by this dispatcher. False if another one got it first."""
+        return db.write(lambda conn: conn.execute(
+            "UPDATE outbox SET status = 'sending', lease_until = ? WHERE id = ? AND status = 'pending'",
+            (time.time() + SEND_LEASE, row_id)).rowcount) == 1
+
+    def dispatch_due(self):
+        """Sends every notification that is due now. Returns how many were sent."""
+        now = time.time()
+        released = db.write(lambda conn: conn.execute(
+            "UPDATE outbox SET status = 'pending', lease_until = NULL WHERE status = 'sending' AND lease_until <= ?",
+            (now,)).rowcount)
+        if released:
+            print(f"Released {released} notification(s) left 'sending' by a stopped dispatcher")
+        due = db.read("""
+            SELECT id, channel, payload, attempts FROM outbox
+            WHERE status = 'pending' AND next_attempt_ts <= ?
+            ORDER BY next_attempt_ts, id
+        """, (now,))
+        sent = 0
+        for row_id, channel, payload, attempts in due:
+            if self._stopping:
+                break
+            if not self._claim(row_id):
+                continue
+            try:
+                result = self.senders[channel].send(json.loads(payload))
+            except Exception as e:
+                self._retry_later(row_id, channel, attempts + 1, e)
+                continue
+            db.write(lambda conn: conn.execute(
+                "UPDATE outbox SET status = 'sent', attempts = ?, sent_ts = ?, last_error = NULL, lease_until = NULL "
+                "WHERE id = ?", (attempts + 1, time.time(), row_id)))
+            print(f"Notification {row_id} ({channel}) sent: {result}")
+            self.sent += 1
+            sent += 1
+        return sent
+
+    def _retry_later(self, row_id, channel, attempts, error):
+        if attempts >= MAX_ATTEMPTS:
+            status, next_ts = 'failed', time.time()
+            self.failed += 1
+            print(f"Notification {row_id} ({channel}) failed after {attempts} attempts: {error}")
+        else:
+            delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+            status, next_ts = 'pending', time.time() + delay
+            self.retries += 1
+            print(f"Notification {row_id} ({channel}) error, retrying in {delay:.0f}s: {error}")
+        db.write(lambda conn: conn.execute(
+            "UPDATE outbox SET status = ?, attempts = ?, next_attempt_ts = ?, last_error = ?, lease_until = NULL "
+            "WHERE id = ?",
+            (status, attempts, next_ts, str(error), row_id)))
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self.is_alive():
+            self.join(timeout=30)
+
+    def stats(self):
+        counts = dict(db.read("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
+        return {"pending": counts.get("pending", 0), "sending": counts.get("sending", 0), "failed_total": counts.get("failed", 0),
+                "sent": self.sent, "retries": self.retries, "failed": self.failed}
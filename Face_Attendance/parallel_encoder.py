@@ -0,0 +1,115 @@
+import os
+import pickle
+import threading
+import time
+
+# Default worker count for bulk encoding (leave one core for the app / OS)
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Batches smaller than this are encoded in-process; starting workers costs more than it saves
+PARALLEL_MIN_IMAGES = 8
+CHECKPOINT_EVERY = 25 # Images between checkpoint saves
+
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+
+class ProgressReporter:
+    """Counts processed images and prints throughput + ETA at most every `interval` seconds."""
+
+    def __init__(self, label, total, callback=None, interval=2.0):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self.interval = interval
+        self.started = time.time()
+        self._last_print = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        rate = self.done / elapsed
+        remaining = self.total - self.done
+        return {
+            "label": self.label,
+            "processed": self.done,
+            "total": self.total,
+            "throughput": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+        }
+
+    def update(self, n=1):
+        with self._lock:
+            self.done += n
+            now = time.time()
+            if now - self._last_print >= self.interval or self.done == self.total:
+                self._last_print = now
+                s = self.snapshot()
+                eta = _format_eta(s["eta_seconds"]) if s["eta_seconds"] is not None else "?"
+                percent = 100.0 * self.done / self.total if self.total else 100.0
+                print(f"[{self.label}] {self.done}/{self.total} images ({percent:.0f}%) "
+                      f"{s['throughput']:.2f} img/s, ETA {eta}")
+        if self.callback:
+            self.callback(self.done, self.total)
+
+
+class Checkpoint:
+    """
+    Results of already-encoded images, saved every CHECKPOINT_EVERY images so an
+    interrupted bulk run resumes where it stopped. Entries are keyed by path and
+    stamped with (mtime, size), so images edited in between are encoded again.
+    """
+
+    def __init__(self, path, model_tag):
+        self.path = path
+        self.model_tag = model_tag
+        self.results = {}
+        self._unsaved = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+                if data.get("model") == model_tag:
+                    self.results = data["results"]
+                    print(f"Resuming from checkpoint: {len(self.results)} images already encoded.")
+            except Exception as e:
+                print(f"Ignoring unreadable checkpoint {path}: {e}")
+
+    @staticmethod
+    def stamp(image_path):
+        st = os.stat(image_path)
+        return (st.st_mtime, st.st_size)
+
+    def get(self, key, image_path):
+        """Returns (True, encoding) if the image was encoded before and has not changed since."""
+        entry = self.results.get(key)
+        if entry is not None and entry[0] == self.stamp(image_path):
+            return True, entry[1]
+        return False, None
+
+    def record(self, key, image_path, encoding):
+        self.results[key] = (self.stamp(image_path), encoding)
+        self._unsaved += 1
+        if self._unsaved >= CHECKPOINT_EVERY:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"model": self.model_tag, "results": self.results}, f)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+    def clear(self):
+        """Called once the gallery has been written."""
+        self.results = {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
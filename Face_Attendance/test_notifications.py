@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import database
+import notifications
+from database import ConnectionPool, migrate_db
+from notifications import NotificationDispatcher, SmtpSender, TwilioSender
+
+
+class StubSMTP:
+    """Stands in for smtplib.SMTP; fails the first `fail_first` messages."""
+
+    def __init__(self, outbox, fail_first=0):
+        self.outbox = outbox
+        self.fail_first = fail_first
+
+    def noop(self):
+        return (250, b"OK")
+
+    def sendmail(self, sender, receiver, message):
+        if self.fail_first > 0:
+            self.fail_first -= 1
+            raise ConnectionError("stub SMTP refused the message")
+        self.outbox.append((sender, receiver))
+
+    def quit(self):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, sid):
+        self.sid = sid
+
+
+class FakeTwilio:
+    """Stands in for twilio.rest.Client (client.messages.create)."""
+
+    def __init__(self, outbox):
+        self.messages = self
+        self.outbox = outbox
+        self._lock = threading.Lock()
+
+    def create(self, from_, body, to):
+        with self._lock:
+            self.outbox.append(body)
+            return FakeMessage(f"SM{len(self.outbox):04d}")
+
+
+def make_dispatcher(emails, whatsapps, fail_first=0):
+    smtp = StubSMTP(emails, fail_first)
+    twilio = FakeTwilio(whatsapps)
+    return NotificationDispatcher({
+        "email": SmtpSender(lambda: smtp, "app@example.com", "admin@example.com"),
+        "whatsapp": TwilioSender(lambda: twilio, "whatsapp:+10000000000", "whatsapp:+10000000001"),
+    })
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def outbox_counts():
+    return dict(notifications.db.read("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
+
+
+def clear_outbox():
+    notifications.db.write(lambda conn: conn.execute("DELETE FROM outbox"))
+
+
+def test_notifications():
+    # Throwaway database, so the real Attendance/attendance.db (and the working directory) are left alone
+    temp_dir = tempfile.mkdtemp()
+    saved = database.db, notifications.db, notifications.RETRY_BASE_DELAY
+    database.db = notifications.db = ConnectionPool(os.path.join(temp_dir, "attendance.db"))
+    notifications.RETRY_BASE_DELAY = 0.2
+    try:
+        migrate_db()
+        check_notifications()
+    finally:
+        database.db.close_all()
+        database.db, notifications.db, notifications.RETRY_BASE_DELAY = saved
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def check_notifications():
+    print("=== SEND WITH RETRY ===")
+    emails, whatsapps = [], []
+    dispatcher = make_dispatcher(emails, whatsapps, fail_first=1)
+    dispatcher.start()
+    dispatcher.enqueue("email", {"subject": "Report", "body": "Session report"})
+    dispatcher.enqueue("whatsapp", {"body": "Ann marked present"})
+    ok = wait_until(lambda: len(emails) == 1 and len(whatsapps) == 1)
+    dispatcher.stop()
+    assert ok, f"email/whatsapp not sent: {dispatcher.stats()}"
+    assert dispatcher.retries == 1, f"expected one retry: {dispatcher.stats()}"
+    print(f"  [PASS] email sent after a retry, whatsapp sent: {dispatcher.stats()}")
+
+    print("\n=== TWO DISPATCHERS, EACH ROW SENT ONCE ===")
+    clear_outbox()
+    whatsapps = []
+    first = make_dispatcher([], whatsapps)
+    second = make_dispatcher([], whatsapps)
+    for i in range(50):
+        first.enqueue("whatsapp", {"body": f"message {i}"})
+    first.start()
+    second.start()
+    ok = wait_until(lambda: outbox_counts().get("sent", 0) == 50)
+    first.stop()
+    second.stop()
+    duplicates = len(whatsapps) - len(set(whatsapps))
+    assert ok, f"not all rows sent: {outbox_counts()}"
+    assert len(whatsapps) == 50 and not duplicates, f"sent {len(whatsapps)} message(s), {duplicates} duplicate(s)"
+    print(f"  [PASS] sent {len(whatsapps)} message(s), no duplicates (first: {first.sent}, second: {second.sent})")
+
+    print("\n=== EXPIRED CLAIM IS RELEASED ===")
+    clear_outbox()
+    whatsapps = []
+    dispatcher = make_dispatcher([], whatsapps)
+    row_id = dispatcher.enqueue("whatsapp", {"body": "left behind"})
+    # As if a dispatcher claimed the row and died before sending it
+    notifications.db.write(lambda conn: conn.execute(
+        "UPDATE outbox SET status = 'sending', lease_until = ? WHERE id = ?", (time.time() - 1, row_id)))
+    sent = dispatcher.dispatch_due()
+    assert sent == 1 and whatsapps == ["left behind"], f"sent {sent}: {whatsapps}"
+    print("  [PASS] released and sent")
+
+    print("\n=== DISPATCHER SURVIVES A DATABASE ERROR ===")
+    dispatcher = make_dispatcher([], whatsapps)
+    db = notifications.db
+    real_read = db.read
+    failures = [2]
+
+    def flaky_read(sql, params=()):
+        if failures[0] > 0:
+            failures[0] -= 1
+            raise database.sqlite3.OperationalError("disk I/O error")
+        return real_read(sql, params)
+
+    db.read = flaky_read
+    dispatcher.start()
+    dispatcher.enqueue("whatsapp", {"body": "after the outage"})
+    ok = wait_until(lambda: "after the outage" in whatsapps)
+    db.read = real_read
+    alive = dispatcher.is_alive()
+    dispatcher.stop()
+    assert ok and alive, f"message sent: {ok}, thread alive: {alive}"
+    print("  [PASS] thread alive and message sent")
+
+    print("\n=== TEST COMPLETED ===")
+
+if __name__ == "__main__":
+    test_notifications()
@@ -0,0 +1,48 @@
+import argparse
+import os
+import numpy as np
+from face_encoder import DATASET_DIR, encode_images
+from parallel_encoder import PARALLEL_MIN_IMAGES
+
+def dataset_images(limit):
+    items = []
+    for student_folder in sorted(os.listdir(DATASET_DIR)):
+        student_path = os.path.join(DATASET_DIR, student_folder)
+        if not os.path.isdir(student_path):
+            continue
+        for filename in sorted(os.listdir(student_path)):
+            items.append((f"{student_folder}/{filename}", os.path.join(student_path, filename)))
+    # Spread over the students rather than taking the first folder only
+    step = max(1, len(items) // limit)
+    return items[::step][:limit]
+
+def assert_same(expected, actual, label):
+    assert expected.keys() == actual.keys(), f"{label}: different images encoded"
+    for key, encoding in expected.items():
+        other = actual[key]
+        if encoding is None or other is None:
+            assert encoding is None and other is None, f"{label}: {key} has a face in only one run"
+        else:
+            assert np.array_equal(encoding, other), \
+                f"{label}: {key} differs (max {np.abs(encoding - other).max():.2e})"
+    print(f"  [PASS] {label}: {len(expected)} encodings identical")
+
+def test_parallel_encoding(limit=PARALLEL_MIN_IMAGES, workers=2):
+    """Serial, reversed and parallel runs must build bit-identical galleries."""
+    if not os.path.exists(DATASET_DIR):
+        print(f"Dataset directory '{DATASET_DIR}' not found.")
+        return
+    items = dataset_images(max(limit, PARALLEL_MIN_IMAGES)) # Fewer images would not use the pool
+
+    print("=== SERIAL VS PARALLEL ENCODING ===")
+    serial = encode_images(items, workers=1)
+    assert_same(serial, encode_images(items[::-1], workers=1), "serial, reversed order")
+    assert_same(serial, encode_images(items, workers=workers), f"parallel, {workers} workers")
+    print("\n=== TEST COMPLETED ===")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that parallel dlib encoding matches the serial run.")
+    parser.add_argument("--limit", type=int, default=PARALLEL_MIN_IMAGES, help="Images to encode")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    test_parallel_encoding(args.limit, args.workers)
@@ -1,18 +1,17 @@
 import cv2
 import face_recognition
 import os
-import pickle
 import random
+from gallery_store import load_gallery
 
 # Load encodings
-ENCODINGS_FILE = "encodings.pkl"
+ENCODINGS_FILE = "encodings.gallery"
+LEGACY_PICKLE_FILE = "encodings.pkl"
 DATASET_DIR = "dataset"
 
 def load_encodings():
     try:
-        with open(ENCODINGS_FILE, "rb") as f:
-            data = pickle.load(f)
-        return data
+        return load_gallery(ENCODINGS_FILE, LEGACY_PICKLE_FILE, model="dlib")
     except Exception as e:
         print(f"Error loading encodings: {e}")
         return None
@@ -1,32 +1,158 @@
 import torch
 from facenet_pytorch import MTCNN, InceptionResnetV1
 from torchvision import datasets, transforms
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Dataset
+from PIL import Image
 import os
-import pickle
+import argparse
 import numpy as np
+from face_prototypes import compile_prototypes
+from gallery_store import write_gallery, write_manifest, file_fingerprint
+from parallel_encoder import DEFAULT_WORKERS, PARALLEL_MIN_IMAGES, ProgressReporter, Checkpoint
 
 # Settings
-DATASET_DIR = 'dataset'
-ENCODINGS_FILE = 'encodings_pt.pkl' # Saving as pickle for consistency with dictionary structure
-
-def generate_encodings_pt():
-    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
-    print(f"Using device: {device}")
-
-    # Initialize MTCNN for face detection (better than dlib for alignment)
-    mtcnn = MTCNN(
-        image_size=160, margin=0, min_face_size=20,
-        thresholds=[0.6, 0.7, 0.7], factor=0.709, post_process=True,
-        device=device
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.join(BASE_DIR, 'dataset')
+ENCODINGS_FILE = os.path.join(BASE_DIR, 'encodings_pt.gallery') # Memory-mapped gallery format (see gallery_store.py)
+MANIFEST_FILE = os.path.join(BASE_DIR, 'encodings_pt.manifest.json')
+CHECKPOINT_FILE = os.path.join(BASE_DIR, 'encodings_pt.checkpoint.pkl')
+MODEL_TAG = "facenet-vggface2-mtcnn160" # Stored in the manifest; changing it forces a full re-encode
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+BATCH_SIZE = 16 # Images per DataLoader batch / FaceNet forward pass
+
+_models = None
+
+def load_models():
+    """MTCNN + FaceNet, created once per process and reused by every training run."""
+    global _models
+    if _models is None:
+        device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+        print(f"Using device: {device}")
+
+        # Initialize MTCNN for face detection (better than dlib for alignment)
+        mtcnn = MTCNN(
+            image_size=160, margin=0, min_face_size=20,
+            thresholds=[0.6, 0.7, 0.7], factor=0.709, post_process=True,
+            device=device
+        )
+
+        # Initialize Inception Resnet V1 (FaceNet)
+        resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+        _models = (mtcnn, resnet, device)
+    return _models
+
+def encode_image_pt(img_path):
+    """Returns the FaceNet embedding of the face MTCNN finds in an image, or None."""
+    mtcnn, resnet, device = load_models()
+
+    # MTCNN expects PIL image or numpy array
+    img = Image.open(img_path)
+
+    # Get cropped face directly from MTCNN
+    # This returns a tensor of shape (3, 160, 160)
+    img_cropped = mtcnn(img)
+    if img_cropped is None:
+        print(f"  No face found in {os.path.basename(img_path)}")
+        return None
+
+    # Calculate embedding
+    img_embedding = resnet(img_cropped.unsqueeze(0).to(device))
+
+    # Detach from graph and convert to numpy
+    return img_embedding.detach().cpu().numpy()[0]
+
+class _ImageFiles(Dataset):
+    """Decodes images in DataLoader workers; MTCNN/FaceNet stay in the main process."""
+
+    def __init__(self, items):
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, i):
+        key, img_path = self.items[i]
+        try:
+            img = Image.open(img_path)
+            img.load()
+            return key, img_path, img, None
+        except Exception as e:
+            return key, img_path, None, e
+
+def _as_list(batch):
+    # PIL images can't be stacked by the default collate; MTCNN takes them as a list
+    return batch
+
+def encode_images_pt(items, workers=DEFAULT_WORKERS, batch_size=BATCH_SIZE, reporter=None, checkpoint=None):
+    """
+    Encodes [(key, image_path), ...] and returns {key: embedding or None}.
+    Images that raised an error are left out of the result.
+    Decoding runs in DataLoader worker processes, MTCNN crops each image exactly
+    as encode_image_pt() does, and FaceNet embeds a whole batch of crops at once.
+    """
+    reporter = reporter or ProgressReporter("facenet", len(items))
+    results = {}
+    todo = []
+    for key, img_path in items:
+        if checkpoint:
+            found, embedding = checkpoint.get(key, img_path)
+            if found:
+                results[key] = embedding
+                reporter.update()
+                continue
+        todo.append((key, img_path))
+    if not todo:
+        return results
+
+    mtcnn, resnet, device = load_models()
+    # Like encode_images(): spawned workers re-import __main__, so only the CLI asks for workers > 1
+    num_workers = workers if workers > 1 and len(todo) >= PARALLEL_MIN_IMAGES else 0
+    loader = DataLoader(
+        _ImageFiles(todo), batch_size=batch_size, num_workers=num_workers, collate_fn=_as_list,
+        multiprocessing_context='spawn' if num_workers else None
     )
 
-    # Initialize Inception Resnet V1 (FaceNet)
-    resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+    def finish(key, img_path, embedding, error=None):
+        if error is not None:
+            print(f"  Error processing {os.path.basename(img_path)}: {error}")
+        else:
+            results[key] = embedding
+            if checkpoint:
+                checkpoint.record(key, img_path, embedding)
+        reporter.update()
+
+    for batch in loader:
+        crops, owners = [], []
+        for key, img_path, img, error in batch:
+            if error is not None:
+                finish(key, img_path, None, error)
+                continue
+            try:
+                img_cropped = mtcnn(img)
+            except Exception as e:
+                finish(key, img_path, None, e)
+                continue
+            if img_cropped is None:
+                print(f"  No face found in {os.path.basename(img_path)}")
+                finish(key, img_path, None)
+                continue
+            crops.append(img_cropped)
+            owners.append((key, img_path))
+
+        if crops:
+            with torch.inference_mode():
+                embeddings = resnet(torch.stack(crops).to(device)).cpu().numpy()
+            for (key, img_path), embedding in zip(owners, embeddings):
+                finish(key, img_path, embedding)
 
+    if checkpoint:
+        checkpoint.save()
+    return results
+
+def generate_encodings_pt(workers=DEFAULT_WORKERS, batch_size=BATCH_SIZE):
     # Prepare dataset
     # We need a custom loader or just iterate folders manually to keep track of IDs
-    
+
     if not os.path.exists(DATASET_DIR):
         print("Dataset directory not found.")
         return
@@ -34,9 +160,14 @@ def generate_encodings_pt():
     known_encodings = []
     known_names = []
     known_ids = []
+    known_paths = []
+    manifest = {}
 
     print("Starting face encoding with PyTorch (FaceNet)...")
 
+    # Collect images first so they can be encoded in batches
+    images = []
+
     # Walk through dataset
     for student_folder in os.listdir(DATASET_DIR):
         folder_path = os.path.join(DATASET_DIR, student_folder)
@@ -51,49 +182,42 @@ def generate_encodings_pt():
             continue
 
         print(f"Processing {student_name} ({student_id})...")
-        
-        image_files = [f for f in os.listdir(folder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        
+
+        image_files = [f for f in os.listdir(folder_path) if f.lower().endswith(IMAGE_EXTENSIONS)]
+
         for img_file in image_files:
             img_path = os.path.join(folder_path, img_file)
-            
-            try:
-                # MTCNN expects PIL image or numpy array
-                from PIL import Image
-                img = Image.open(img_path)
-                
-                # Get cropped face directly from MTCNN
-                # This returns a tensor of shape (3, 160, 160)
-                img_cropped = mtcnn(img)
+            images.append((f"{student_folder}/{img_file}", img_path, student_id, student_name))
 
-                if img_cropped is not None:
-                    # Calculate embedding
-                    img_embedding = resnet(img_cropped.unsqueeze(0).to(device))
-                    
-                    # Detach from graph and convert to numpy
-                    embedding_numpy = img_embedding.detach().cpu().numpy()[0]
-                    
-                    known_encodings.append(embedding_numpy)
-                    known_names.append(student_name)
-                    known_ids.append(student_id)
-                else:
-                    print(f"  No face found in {img_file}")
-            
-            except Exception as e:
-                print(f"  Error processing {img_file}: {e}")
+    checkpoint = Checkpoint(CHECKPOINT_FILE, MODEL_TAG)
+    results = encode_images_pt([(rel_path, img_path) for rel_path, img_path, _, _ in images], workers, batch_size, checkpoint=checkpoint)
 
-    # Save encodings
-    data = {
-        "encodings": known_encodings,
-        "names": known_names,
-        "ids": known_ids
-    }
+    # Assemble in dataset order, exactly as the one-by-one loop did
+    for rel_path, img_path, student_id, student_name in images:
+        if rel_path not in results:
+            continue
+        embedding_numpy = results[rel_path]
+        manifest[rel_path] = dict(file_fingerprint(img_path), face=embedding_numpy is not None)
+        if embedding_numpy is not None:
+            known_encodings.append(embedding_numpy)
+            known_names.append(student_name)
+            known_ids.append(student_id)
+            known_paths.append(rel_path)
 
-    with open(ENCODINGS_FILE, "wb") as f:
-        pickle.dump(data, f)
+    # Save encodings (atomically swapped in, see gallery_store.py)
+    # Compiled per-student prototypes are stored alongside (optional fast path, see face_prototypes.py)
+    prototypes = compile_prototypes(known_encodings, known_names, known_ids)
+    write_gallery(ENCODINGS_FILE, known_encodings, known_names, known_ids, prototypes, model="facenet", paths=known_paths)
+    # Manifest lets incremental_trainer.py skip unchanged images next time
+    write_manifest(MANIFEST_FILE, MODEL_TAG, manifest)
+    checkpoint.clear()
 
     print(f"\nEncodings saved to {ENCODINGS_FILE}")
     print(f"Total faces encoded: {len(known_encodings)}")
 
 if __name__ == "__main__":
-    generate_encodings_pt()
+    parser = argparse.ArgumentParser(description="Encode every image in dataset/ with FaceNet.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="DataLoader worker processes (1 = in-process)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    generate_encodings_pt(args.workers, args.batch_size)
@@ -0,0 +1,118 @@
+import threading
+import time
+import traceback
+
+
+class TrainingQueue:
+    """
+    Runs training jobs on one background worker, one job at a time.
+
+    Submitting while a job is queued returns that job (coalesced). Submitting
+    while a job is running queues at most one follow-up, so images added
+    after the running job scanned dataset/ still get picked up.
+    `on_finish(summaries)` runs on the worker once a job succeeds, e.g. to
+    swap the new galleries into the recognizers.
+    """
+
+    def __init__(self, train_fn, on_finish=None):
+        self.train_fn = train_fn
+        self.on_finish = on_finish
+        self._cond = threading.Condition()
+        self._thread = None
+        self._next_id = 1
+        self._queued = None
+        self._running = None
+        self._last = None
+
+    def _new_job(self):
+        job = {
+            "id": self._next_id,
+            "state": "queued",
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "stage": None,       # Model currently being encoded
+            "processed": 0,
+            "total": 0,
+            "stage_started": None,
+            "summaries": [],
+            "error": None,
+            "submissions": 1,
+        }
+        self._next_id += 1
+        return job
+
+    def submit(self):
+        """Queues a training run (or joins the already queued one). Returns (job status, coalesced)."""
+        with self._cond:
+            if self._queued is not None:
+                self._queued["submissions"] += 1
+                return self._snapshot(self._queued), True
+            self._queued = self._new_job()
+            job = self._queued
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="TrainingQueue", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            return self._snapshot(job), False
+
+    def _progress(self, model, done, total):
+        with self._cond:
+            job = self._running
+            if job is None:
+                return
+            if job["stage"] != model:
+                job["stage"] = model
+                job["stage_started"] = time.time()
+            job["processed"] = done
+            job["total"] = total
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queued is not None)
+                job = self._running = self._queued
+                self._queued = None
+                job["state"] = "running"
+                job["started"] = time.time()
+
+            try:
+                summaries = self.train_fn(progress=self._progress)
+                if self.on_finish:
+                    self.on_finish(summaries)
+                state, error = "done", None
+            except Exception as e:
+                traceback.print_exc()
+                summaries, state, error = [], "failed", str(e)
+
+            with self._cond:
+                job["summaries"] = summaries
+                job["state"] = state
+                job["error"] = error
+                job["finished"] = time.time()
+                self._last = job
+                self._running = None
+            print(f"Training job {job['id']} {state} in {job['finished'] - job['started']:.1f}s")
+
+    def _snapshot(self, job):
+        status = {k: job[k] for k in ("id", "state", "stage", "processed", "total", "summaries", "error", "submissions")}
+        throughput, eta = None, None
+        if job["state"] == "running" and job["stage_started"] and job["processed"]:
+            elapsed = max(time.time() - job["stage_started"], 1e-6)
+            throughput = job["processed"] / elapsed
+            eta = (job["total"] - job["processed"]) / throughput
+        status["throughput"] = round(throughput, 2) if throughput is not None else None
+        status["eta_seconds"] = round(eta, 1) if eta is not None else None
+        end = job["finished"] or time.time()
+        status["elapsed_seconds"] = round(end - job["started"], 1) if job["started"] else None
+        return status
+
+    def status(self):
+        """JSON-friendly view: the running job (else the last finished one) and any queued follow-up."""
+        with self._cond:
+            current = self._running or self._last
+            return {
+                "busy": self._running is not None or self._queued is not None,
+                "job": self._snapshot(current) if current else None,
+                "queued": self._snapshot(self._queued) if self._queued else None,
+            }
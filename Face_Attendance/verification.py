@@ -0,0 +1,67 @@
+import threading
+from face_recognizer import THRESHOLD
+
+# Early-exit verification (dlib distances; THRESHOLD is the dlib match threshold)
+EARLY_ACCEPT_BELOW = 0.30 # dlib alone accepts a match this close
+EARLY_REJECT_ABOVE = THRESHOLD # dlib alone rejects a face this far from everyone (double verification needs a dlib match)
+
+
+class EarlyExitPolicy:
+    """
+    Decides per face whether dlib's answer is clear enough to skip FaceNet.
+
+    Faces whose best dlib distance is below `accept_below` are accepted on
+    dlib alone, and faces above `reject_above` are rejected as Unknown. Only
+    faces in between (below THRESHOLD, but not clearly) go on to FaceNet and
+    the agree/conflict check. A face dlib calls Unknown can never pass double
+    verification, so rejecting above THRESHOLD changes no result; a lower
+    reject_above would, and is refused. Set accept_below=0 and
+    reject_above=float("inf") to always run both.
+    """
+
+    def __init__(self, accept_below=EARLY_ACCEPT_BELOW, reject_above=EARLY_REJECT_ABOVE):
+        if accept_below > THRESHOLD:
+            raise ValueError(f"accept_below ({accept_below}) must not exceed the dlib THRESHOLD ({THRESHOLD})")
+        if reject_above < THRESHOLD:
+            raise ValueError(f"reject_above ({reject_above}) must not be below the dlib THRESHOLD ({THRESHOLD})")
+        self.accept_below = accept_below
+        self.reject_above = reject_above
+        self._lock = threading.Lock() # Shared by every recognition worker
+        # Metrics
+        self.accepted_early = 0
+        self.rejected_early = 0
+        self.both_models = 0
+
+    def split(self, dlib_results):
+        """
+        Returns ({index: (student_id, name) or None} decided by dlib alone,
+        [indices that still need FaceNet]).
+        """
+        decided, ambiguous = {}, []
+        for i, (name, student_id, distance) in enumerate(dlib_results):
+            if student_id and distance < self.accept_below:
+                print(f"Verified: {name} (Dlib {distance:.2f}, FaceNet skipped)")
+                decided[i] = (student_id, name)
+            elif distance > self.reject_above:
+                decided[i] = None
+            else:
+                ambiguous.append(i)
+        accepted = sum(1 for identity in decided.values() if identity is not None)
+        with self._lock:
+            self.accepted_early += accepted
+            self.rejected_early += len(decided) - accepted
+            self.both_models += len(ambiguous)
+        return decided, ambiguous
+
+    def stats(self):
+        with self._lock:
+            accepted, rejected, both = self.accepted_early, self.rejected_early, self.both_models
+        total = accepted + rejected + both
+        return {
+            "accept_below": self.accept_below,
+            "reject_above": self.reject_above,
+            "accepted_early": accepted,
+            "rejected_early": rejected,
+            "both_models": both,
+            "facenet_skipped_ratio": round((total - both) / total, 3) if total else None,
+        }
@@ -0,0 +1,418 @@
+import threading
+import time
+import cv2
+
+# Pipeline settings
+JPEG_QUALITY = 80
+ANNOTATION_TTL = 1.0  # Seconds a recognition result stays drawn on newer frames
+STALL_TIMEOUT = 1.0  # Seconds without a camera frame before showing the placeholder
+
+
+class LatestSlot:
+    """
+    Single-value mailbox shared between threads.
+    Writers overwrite the previous value (drop-oldest), readers always see the newest one.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._value = None
+        self._seq = 0
+        self._stamp = 0.0
+        self.on_put = None # Optional callback after every put (e.g. to wake a RecognitionScheduler)
+
+    def put(self, value):
+        with self._cond:
+            self._value = value
+            self._seq += 1
+            self._stamp = time.time()
+            self._cond.notify_all()
+        if self.on_put:
+            self.on_put()
+
+    def peek(self):
+        with self._cond:
+            return self._seq, self._value, self._stamp
+
+    def wait_newer(self, seq, timeout=None):
+        """Blocks until a value newer than `seq` is published (or timeout). Returns (seq, value, stamp)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != seq, timeout)
+            return self._seq, self._value, self._stamp
+
+
+class FrameBroadcaster:
+    """
+    One producer, many consumers for the MJPEG stream.
+    Each frame is wrapped into a multipart chunk once and every subscriber
+    yields that same bytes object. Subscribers keep their own position, so a
+    slow client simply skips to the newest frame and never holds up the others.
+    """
+
+    def __init__(self):
+        self._slot = LatestSlot()
+        self._lock = threading.Lock()
+        self.subscribers = 0
+        self.frames_skipped = 0
+
+    def publish(self, jpeg_bytes):
+        self._slot.put(b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n')
+
+    def subscribe(self):
+        """Generator of multipart chunks for one client. Unsubscribes when the client disconnects."""
+        with self._lock:
+            self.subscribers += 1
+        try:
+            seq = 0
+            while True:
+                new_seq, chunk, _ = self._slot.wait_newer(seq, timeout=1.0)
+                if new_seq == seq or chunk is None:
+                    continue
+                if seq:
+                    skipped = new_seq - seq - 1
+                    if skipped:
+                        with self._lock:
+                            self.frames_skipped += skipped
+                seq = new_seq
+                yield chunk
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+
+
+class _Worker(threading.Thread):
+    def __init__(self, name):
+        super().__init__(name=name, daemon=True)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+
+class CaptureThread(_Worker):
+    """Reads the camera as fast as it delivers and keeps only the latest frame."""
+
+    def __init__(self, open_camera, release_camera, frames):
+        super().__init__("capture")
+        self.open_camera = open_camera
+        self.release_camera = release_camera
+        self.frames = frames
+        self.frames_read = 0
+
+    def run(self):
+        while not self.stopped:
+            try:
+                camera = self.open_camera()
+                if camera is None or not camera.isOpened():
+                    print("Waiting for camera...")
+                    time.sleep(1)
+                    continue
+
+                success, frame = camera.read()
+            except Exception as e:
+                # A driver/backend error must not kill the thread; reopen the camera instead
+                print(f"Camera error: {e}. Resetting...")
+                self._release()
+                time.sleep(1)
+                continue
+            if not success:
+                print("Failed to read frame from camera. Resetting...")
+                self._release()
+                time.sleep(0.5)
+                continue
+
+            self.frames_read += 1
+            self.frames.put(frame)
+
+        self._release()
+
+    def _release(self):
+        try:
+            self.release_camera()
+        except Exception as e:
+            print(f"Error releasing camera: {e}")
+
+
+class RecognitionThread(_Worker):
+    """
+    Runs `process_fn(frame)` on the newest captured frame at its own pace.
+    Frames that arrive while a frame is being processed are dropped, so the
+    result is never more than one inference behind the camera.
+    """
+
+    def __init__(self, frames, results, process_fn):
+        super().__init__("recognition")
+        self.frames = frames
+        self.results = results
+        self.process_fn = process_fn
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.last_latency = 0.0
+
+    def run(self):
+        seq = 0
+        while not self.stopped:
+            new_seq, frame, _ = self.frames.wait_newer(seq, timeout=0.5)
+            if new_seq == seq or frame is None:
+                continue
+            if seq:
+                self.frames_dropped += new_seq - seq - 1
+            seq = new_seq
+
+            start = time.time()
+            try:
+                result = self.process_fn(frame)
+            except Exception as e:
+                print(f"Recognition error: {e}")
+                continue
+            self.last_latency = time.time() - start
+            self.frames_processed += 1
+            self.results.put(result)
+
+
+class RecognitionCounters:
+    """Recognition stats of a pipeline whose frames are processed by a shared RecognitionScheduler."""
+
+    def __init__(self):
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.last_latency = 0.0
+
+
+class RecognitionScheduler:
+    """
+    Recognition workers shared by several pipelines (one per camera).
+
+    Workers take cameras round-robin: each pass over the cameras processes
+    the newest frame of every camera that has one, so a fast camera cannot
+    starve a slow one, and a camera is never processed by two workers at once
+    (its tracker / identity state is not shared between threads). Frames that
+    arrive while a camera waits its turn are dropped, as in RecognitionThread.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = max(1, int(workers))
+        self._cond = threading.Condition()
+        self._pipelines = []
+        self._seen = {} # pipeline -> last frame seq processed
+        self._busy = set()
+        self._next = 0
+        self._threads = []
+        self._avg_latency = 0.0
+        self.jobs = 0
+
+    def add(self, pipeline):
+        with self._cond:
+            if pipeline not in self._pipelines:
+                self._pipelines.append(pipeline)
+                self._seen[pipeline] = pipeline.frames.peek()[0]
+                pipeline.frames.on_put = self._wake
+            if not self._threads:
+                for i in range(self.workers):
+                    t = threading.Thread(target=self._run, name=f"recognition-{i}", daemon=True)
+                    t.start()
+                    self._threads.append(t)
+            self._cond.notify_all()
+
+    def remove(self, pipeline):
+        with self._cond:
+            if pipeline in self._pipelines:
+                self._pipelines.remove(pipeline)
+                self._seen.pop(pipeline, None)
+                pipeline.frames.on_put = None
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify()
+
+    def _pick(self):
+        """Next camera (round-robin) that is idle and has a frame it has not processed yet."""
+        count = len(self._pipelines)
+        for offset in range(count):
+            index = (self._next + offset) % count
+            pipeline = self._pipelines[index]
+            if pipeline in self._busy:
+                continue
+            seq, frame, _ = pipeline.frames.peek()
+            if frame is None or seq == self._seen[pipeline]:
+                continue
+            self._next = index + 1
+            return pipeline, seq, frame
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._pick()
+                while job is None:
+                    self._cond.wait(timeout=0.5)
+                    job = self._pick()
+                pipeline, seq, frame = job
+                self._busy.add(pipeline)
+                if self._seen[pipeline]:
+                    pipeline.recognition.frames_dropped += seq - self._seen[pipeline] - 1
+
+            start = time.time()
+            try:
+                result = pipeline.process_fn(frame)
+            except Exception as e:
+                print(f"Recognition error: {e}")
+                result = None
+            latency = time.time() - start
+
+            with self._cond:
+                self._busy.discard(pipeline)
+                if pipeline in self._seen:
+                    self._seen[pipeline] = seq
+                self._avg_latency = 0.9 * self._avg_latency + 0.1 * latency if self.jobs else latency
+                self.jobs += 1
+                self._cond.notify_all()
+            pipeline.recognition.last_latency = latency
+            pipeline.recognition.frames_processed += 1
+            pipeline.results.put(result)
+
+    def round_time(self):
+        """Roughly how long a camera waits between two of its frames being processed."""
+        with self._cond:
+            return self._avg_latency * max(len(self._pipelines), 1) / self.workers
+
+    def stats(self):
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "cameras": len(self._pipelines),
+                "jobs": self.jobs,
+                "avg_latency_ms": round(self._avg_latency * 1000, 1),
+            }
+
+
+class EncoderThread(_Worker):
+    """Draws the latest recognition result onto every new frame and publishes it to the broadcaster."""
+
+    def __init__(self, frames, results, render_fn, output, annotation_ttl=lambda: ANNOTATION_TTL):
+        super().__init__("encoder")
+        self.frames = frames
+        self.results = results
+        self.render_fn = render_fn
+        self.output = output
+        self.annotation_ttl = annotation_ttl
+        self.frames_encoded = 0
+
+    def run(self):
+        seq = 0
+        while not self.stopped:
+            new_seq, frame, _ = self.frames.wait_newer(seq, timeout=STALL_TIMEOUT)
+            if new_seq == seq:
+                frame = None  # Camera stalled -> placeholder
+            else:
+                seq = new_seq
+                if frame is not None:
+                    # The recognition thread may be reading the same array
+                    frame = frame.copy()
+
+            if not self.output.subscribers:
+                continue  # Nobody is watching -> skip drawing and JPEG encoding
+
+            _, result, stamp = self.results.peek()
+            if time.time() - stamp > self.annotation_ttl():
+                result = None
+
+            try:
+                frame = self.render_fn(frame, result)
+                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            except Exception as e:
+                print(f"Encoder error: {e}")
+                continue
+            if ret:
+                self.frames_encoded += 1
+                self.output.publish(buffer.tobytes())
+
+
+class VideoPipeline:
+    """
+    capture thread -> [latest frame] -> recognition thread -> [latest result]
+                     [latest frame] + [latest result] -> encoder thread -> broadcaster -> N viewers
+
+    With a `scheduler`, recognition runs on the scheduler's shared workers
+    instead of a recognition thread of its own (one pipeline per camera).
+    """
+
+    def __init__(self, open_camera, release_camera, process_fn, render_fn, scheduler=None):
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+        self.broadcaster = FrameBroadcaster()
+        self.process_fn = process_fn
+        self.scheduler = scheduler
+        self._args = (open_camera, release_camera, render_fn)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.recognition = None
+        self.started_at = None
+
+    def start(self):
+        """Starts the pipeline; if it is already running, restarts only threads that have died."""
+        with self._lock:
+            if self._threads:
+                for i, t in enumerate(self._threads):
+                    if not t.is_alive():
+                        print(f"Pipeline {t.name} thread died, restarting it")
+                        self._threads[i] = self._make_thread(t.name)
+                        self._threads[i].start()
+                return
+            if self.scheduler is None:
+                self._threads = [self._make_thread(name) for name in ("capture", "encoder", "recognition")]
+            else:
+                self.recognition = RecognitionCounters()
+                self._threads = [self._make_thread(name) for name in ("capture", "encoder")]
+            for t in self._threads:
+                t.start()
+            if self.scheduler is not None:
+                self.scheduler.add(self)
+            self.started_at = time.time()
+
+    def _make_thread(self, name):
+        open_camera, release_camera, render_fn = self._args
+        if name == "capture":
+            return CaptureThread(open_camera, release_camera, self.frames)
+        if name == "encoder":
+            if self.scheduler is None:
+                annotation_ttl = lambda: ANNOTATION_TTL
+            else:
+                # Results only refresh once per round over all cameras
+                annotation_ttl = lambda: max(ANNOTATION_TTL, 2 * self.scheduler.round_time())
+            return EncoderThread(self.frames, self.results, render_fn, self.broadcaster, annotation_ttl)
+        self.recognition = RecognitionThread(self.frames, self.results, self.process_fn)
+        return self.recognition
+
+    def stop(self):
+        with self._lock:
+            if self.scheduler is not None:
+                self.scheduler.remove(self)
+            for t in self._threads:
+                t.stop()
+            for t in self._threads:
+                t.join(timeout=2)
+            self._threads = []
+
+    def stats(self):
+        if not self._threads:
+            return {"running": False}
+        capture, encoder = self._threads[:2]
+        recognition = self.recognition
+        uptime = max(time.time() - self.started_at, 1e-6)
+        return {
+            "running": True,
+            "uptime": round(uptime, 1),
+            "capture_fps": round(capture.frames_read / uptime, 2),
+            "recognition_fps": round(recognition.frames_processed / uptime, 2),
+            "recognition_latency_ms": round(recognition.last_latency * 1000, 1),
+            "recognition_dropped_frames": recognition.frames_dropped,
+            "stream_fps": round(encoder.frames_encoded / uptime, 2),
+            "viewers": self.broadcaster.subscribers,
+            "viewer_skipped_frames": self.broadcaster.frames_skipped,
+        }